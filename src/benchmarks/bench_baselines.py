@@ -0,0 +1,113 @@
+# ==================
+# bench_baselines.py
+# ==================
+#
+# Baseline estimation of 8-channel events: fn.find_baseline called per
+# waveform (as Event.zero_baselines did) against fn.find_baselines on a
+# whole (events x channels x samples) block, for growing block sizes, and
+# the pre-trigger fn.robust_baselines on clean events (pulses after the
+# trigger) and on events with pulses anywhere (pile-up fallback), and on
+# clean events quantized to an 8-bit digitizer step with noise of 1-2 mV,
+# where the MAD of the noise is 0.
+# Synthetic waveforms: noise on a random offset plus up to three pulses.
+#
+# Usage: python bench_baselines.py [points]
+
+
+import os
+import sys
+import time
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def synthetic_block(events, channels=8, points=1000, seed=0, clean=False, noise=3, step=None):
+    """
+    Returns an (events x channels x points) block of noisy waveforms in mV.
+    With clean, pulses only arrive after the trigger at the midpoint. With
+    step, the waveforms are quantized to multiples of step mV.
+    """
+    rng   = np.random.default_rng(seed)
+    block = rng.normal(0, noise, (events, channels, points)) + rng.normal(0, 20, (events, channels, 1))
+    t     = np.arange(points)
+    for wf in block.reshape(-1, points):
+        for _ in range(rng.integers(0, 4)):
+            wf += rng.uniform(5, 300) * np.exp(-0.5 * ((t - rng.integers(points//2 if clean else 0, points)) / rng.uniform(2, 20))**2)
+
+    if step is not None:
+        block = np.round(block / step) * step
+
+    return block
+
+
+if __name__ == '__main__':
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    # Warm up scipy before timing
+    fn.find_baseline(synthetic_block(1, points=points)[0, 0])
+    fn.find_baselines(synthetic_block(1, points=points))
+
+    for events in [1, 10, 100, 1000]:
+        block = synthetic_block(events, points=points)
+
+        start = time.perf_counter()
+        ref   = np.array([[fn.find_baseline(wf)[0] for wf in event] for event in block])
+        t_scalar = time.perf_counter() - start
+
+        batch = block.copy()
+        start = time.perf_counter()
+        mean, std = fn.find_baselines(batch)
+        t_batch = time.perf_counter() - start
+
+        err = np.abs(ref - mean).max()
+        print(f'{events:5d} events: find_baseline {events/t_scalar:8.0f} events/s, '
+              f'find_baselines {events/t_batch:8.0f} events/s ({t_scalar/t_batch:4.1f}x), max |diff| {err:.2g} mV')
+
+    for clean in [True, False]:
+        block = synthetic_block(1000, points=points, clean=clean)
+
+        start = time.perf_counter()
+        ref, _ = fn.find_baselines(block.copy())
+        t_peaks = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mean, std, pileup = fn.robust_baselines(block.copy())
+        t_robust = time.perf_counter() - start
+
+        err = np.abs(ref - mean)[~pileup]
+        print(f'{"clean" if clean else "pulses anywhere":15s}: find_baselines {1000/t_peaks:6.0f} events/s, '
+              f'robust_baselines {1000/t_robust:6.0f} events/s ({t_peaks/t_robust:4.1f}x), '
+              f'pile-up {pileup.mean():.1%}, median |diff| {np.median(err):.2g} mV')
+
+    # 8-bit digitizer at 800 mV full scale: 3.125 mV steps
+    for noise in [1, 2]:
+        block = synthetic_block(1000, points=points, clean=True, noise=noise, step=3.125)
+
+        start = time.perf_counter()
+        ref, _ = fn.find_baselines(block.copy())
+        t_peaks = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mean, std, pileup = fn.robust_baselines(block.copy())
+        t_robust = time.perf_counter() - start
+
+        err = np.abs(ref - mean)[~pileup]
+        print(f'{f"quantized, {noise} mV":15s}: find_baselines {1000/t_peaks:6.0f} events/s, '
+              f'robust_baselines {1000/t_robust:6.0f} events/s ({t_peaks/t_robust:4.1f}x), '
+              f'pile-up {pileup.mean():.1%}, median |diff| {np.median(err):.2g} mV')
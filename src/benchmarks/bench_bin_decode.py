@@ -0,0 +1,95 @@
+# ===================
+# bench_bin_decode.py
+# ===================
+#
+# Benchmarks the per-sample struct decoding previously used in
+# IF_bin_to_csv.py against the bulk np.frombuffer decoder, on a
+# synthetic multi-segment InfiniiVision binary file.
+#
+# Usage: python bench_bin_decode.py [segments] [channels] [points]
+
+
+import os
+import sys
+import io
+import struct
+import time
+import tempfile
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.binfile as bf
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def decode_legacy(bin_input, buffer_size, bytes_per_point, x_origin, x_increment, csv):
+    """
+    The original per-sample decoding loop of read_32bit_float_data.
+    """
+    for i in range(int(buffer_size / bytes_per_point)):
+        (voltage,) = struct.unpack('f', bin_input.read(bytes_per_point))
+        csv.write("%E, %f\n" % (x_origin + (i * x_increment), voltage))
+
+
+def decode_bulk(bin_input, buffer_size, bytes_per_point, x_origin, x_increment, csv):
+    """
+    The bulk decoding path now used by read_32bit_float_data.
+    """
+    voltage = bf.decode_float_buffer(bin_input.read(buffer_size), bytes_per_point)
+    t       = bf.time_axis(x_origin, x_increment, len(voltage))
+    bf.write_csv_block(csv, "%E, %f\n", t, voltage)
+
+
+def run(filepath, decoder, write_csv=True):
+    """
+    Walks every waveform buffer of the file with the given decoder and
+    returns the elapsed wall time in seconds.
+    """
+    start = time.perf_counter()
+    with open(filepath, 'rb') as bin_input:
+        (_, _, _, waveforms) = struct.unpack('<2s2sii', bin_input.read(12))
+        for i in range(waveforms):
+            header = struct.unpack('<iiiiifdddii16s16s24s16sdI', bin_input.read(140))
+            buffers, x_increment, x_origin = header[2], header[7], header[8]
+            for j in range(buffers):
+                (_, _, bytes_per_point, buffer_size) = struct.unpack('<ihhi', bin_input.read(12))
+                if write_csv:
+                    csv = io.StringIO()
+                    decoder(bin_input, buffer_size, bytes_per_point, x_origin, x_increment, csv)
+                else:
+                    bf.decode_float_buffer(bin_input.read(buffer_size), bytes_per_point)
+
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    points   = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, 'scope-1-run0.bin')
+        bf.write_synthetic_bin(filepath, segments=segments, channels=channels, points=points)
+        size_mb = os.path.getsize(filepath) / 1e6
+
+        t_legacy = run(filepath, decode_legacy)
+        t_bulk   = run(filepath, decode_bulk)
+        t_decode = run(filepath, decode_bulk, write_csv=False)
+
+    print(f'{segments} segments x {channels} channels x {points} points ({size_mb:.1f} MB)')
+    print(f'legacy struct + csv   : {t_legacy:8.3f} s')
+    print(f'bulk frombuffer + csv : {t_bulk:8.3f} s  ({t_legacy/t_bulk:5.1f}x)')
+    print(f'bulk decode only      : {t_decode:8.3f} s  ({t_legacy/t_decode:5.1f}x)')
@@ -0,0 +1,118 @@
+# ============
+# bench_cfd.py
+# ============
+#
+# Timing of 8-channel events with scope-like pulses (2 ns rise, 8 ns decay)
+# at a fixed arrival time and random amplitudes (150-600 mV):
+#   - throughput of get_first_peaks + leading_edge_times against cfd_times
+#   - throughput of the paths users run, Event.calc_risetime_mtx per event
+#     and EventBatch.from_dataset, with either method, and the fraction of
+#     plates each one times
+#   - spread of the timed arrival across amplitudes (walk) for a fixed
+#     threshold, a leading-edge fraction and the CFD
+#
+# Usage: python bench_cfd.py [events] [fraction] [delay_ns]
+
+
+import os
+import sys
+import io
+import time
+import contextlib
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    from utils.timeaxis import TimeAxis
+    from models.event import Event
+    from models.batch import EventBatch
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def pulse_block(events, channels=8, t=None, t0=5.0, noise=2.0, seed=0):
+    """
+    Returns an (events x channels x samples) block of pulses arriving at t0 ns
+    with random amplitudes, and the amplitudes.
+    """
+    rng   = np.random.default_rng(seed)
+    tv    = np.asarray(t)
+    amp   = rng.uniform(150, 600, (events, channels))
+    x     = np.clip(tv - t0, 0, None)
+    shape = (1 - np.exp(-x / 2.0)) * np.exp(-x / 8.0)
+    shape = shape / shape.max()
+    block = amp[..., None] * shape + rng.normal(0, noise, (events, channels, len(tv)))
+
+    return block, amp
+
+
+def walk(times, amp):
+    """
+    Returns the spread (ns) of the timed arrival and its correlation with amplitude.
+    """
+    ok = np.isfinite(times)
+    return np.std(times[ok]), np.corrcoef(amp[ok], times[ok])[0, 1]
+
+
+if __name__ == '__main__':
+    events   = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    delay    = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+
+    t          = TimeAxis(-50, 0.1, 1000)
+    block, amp = pulse_block(events, t=t)
+    ROI        = (fn.time_index(t, 0), fn.time_index(t, 40))
+    fn.cfd_times(block[:1], t, ROI)
+
+    start = time.perf_counter()
+    peaks, _ = fn.get_first_peaks(block, 140, ROI)
+    t_le     = fn.leading_edge_times(block, t, peaks, ROI[0], fraction=fraction)
+    t_peaks  = time.perf_counter() - start
+    t_const  = fn.leading_edge_times(block, t, peaks, ROI[0], const=100)
+
+    start = time.perf_counter()
+    t_cfd = fn.cfd_times(block, t, ROI, fraction=fraction, delay=delay, threshold=140)
+    t_run = time.perf_counter() - start
+
+    print(f'{events} events x {block.shape[1]} channels, fraction {fraction}, CFD delay {delay} ns')
+    print(f'peaks + leading edge : {events/t_peaks:8.0f} events/s')
+    print(f'cfd_times            : {events/t_run:8.0f} events/s ({t_peaks/t_run:4.1f}x)')
+    print(f'armed / with a first peak: {np.isfinite(t_cfd).mean():.3f} / {(peaks != -1).mean():.3f}')
+
+    # The paths users run, from the (already baselined) waveforms to the plate dt
+    from bench_event_batch import synthetic_dataset
+    dataset = synthetic_dataset(events, t)
+    for method in ['leading-edge', 'cfd']:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for wfs in block:
+                event       = Event('', 1, [('scope-1', 4), ('scope-2', 4)])
+                event.data  = list(wfs)
+                event.times = [t, t]
+                event.calc_risetime_mtx((0, 40), 140, fraction, method=method, delay=delay)
+        t_event = time.perf_counter() - start
+
+        start   = time.perf_counter()
+        batch   = EventBatch.from_dataset(dataset, (0, 40), 140, fraction, method=method, delay=delay,
+                                          baseline=None)
+        t_batch = time.perf_counter() - start
+
+        print(f'{method:12s}: calc_risetime_mtx {events/t_event:6.0f} events/s, '
+              f'from_dataset {events/t_batch:6.0f} events/s, '
+              f'plates timed {np.isfinite(batch.dt[:len(batch)]).mean():.3f}')
+
+    for label, times in [('threshold 100 mV', t_const), (f'leading edge {fraction}', t_le), ('cfd', t_cfd)]:
+        spread, corr = walk(times, amp)
+        print(f'{label:20s}: arrival spread {spread*1e3:7.1f} ps, correlation with amplitude {corr:+.2f}')
@@ -0,0 +1,70 @@
+# =================
+# bench_csv_load.py
+# =================
+#
+# Microbenchmark of fn.get_waveform on a converted 1000-segment run:
+# the original csv.reader + list() path against the np.loadtxt path that
+# parses only the needed columns in C.
+#
+# Usage: python bench_csv_load.py [segments] [points]
+
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    import utils.binfile as bf
+    import utils.convert as cv
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def run(csvfiles, **kwargs):
+    """
+    Loads every csv file with get_waveform and returns the elapsed wall
+    time in seconds.
+    """
+    start = time.perf_counter()
+    for csvfile in csvfiles:
+        fn.get_waveform(csvfile, cache=False, **kwargs)
+
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    points   = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, 'scope-1-run0.bin')
+        bf.write_synthetic_bin(bin_path, segments=segments, channels=1, points=points)
+        cv.convert_file(bin_path, tmp)
+
+        csvfiles = [os.path.join(tmp, f'scope-1-run0_segment-{seg}_1.csv') for seg in range(1, segments + 1)]
+
+        print(f'{segments} segments x {points} points, one csv file per segment')
+        for label, kwargs in [('voltage only', dict(yconv=1e3)),
+                              ('time + voltage', dict(xignore=False, xconv=1e9, yconv=1e3))]:
+            t_legacy = run(csvfiles, fast=False, **kwargs)
+            t_fast   = run(csvfiles, **kwargs)
+            t_fast32 = run(csvfiles, dtype=np.float32, **kwargs)
+
+            print(f'{label:15s}: csv.reader {t_legacy/segments*1e3:6.3f} ms/file, '
+                  f'np.loadtxt {t_fast/segments*1e3:6.3f} ms/file ({t_legacy/t_fast:4.1f}x), '
+                  f'float32 {t_fast32/segments*1e3:6.3f} ms/file ({t_legacy/t_fast32:4.1f}x)')
@@ -0,0 +1,107 @@
+# =======================
+# bench_digital_decode.py
+# =======================
+#
+# Benchmarks the per-byte hex-string unpacking of 8-bit digital (logic)
+# buffers previously used in IF_bin_to_csv.py against the vectorized
+# np.frombuffer + np.unpackbits decoder.
+#
+# Usage: python bench_digital_decode.py [segments] [points]
+
+
+import os
+import sys
+import io
+import struct
+import time
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.binfile as bf
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+hex_to_binary_dict = {
+    "0" : "0000", "1" : "0001", "2" : "0010", "3" : "0011",
+    "4" : "0100", "5" : "0101", "6" : "0110", "7" : "0111",
+    "8" : "1000", "9" : "1001", "a" : "1010", "b" : "1011",
+    "c" : "1100", "d" : "1101", "e" : "1110", "f" : "1111",
+}
+
+
+def decode_legacy(bin_input, buffer_size, x_origin, x_increment, csv):
+    """
+    The original per-byte loop of read_8bit_digital_data.
+    """
+    for i in range(buffer_size):
+        (digital_data,) = struct.unpack('B', bin_input.read(1))
+
+        hex_string = hex(digital_data)
+        if len(hex_string) == 4:
+              un = hex_to_binary_dict[hex_string[2]]
+              ln = hex_to_binary_dict[hex_string[3]]
+        else:
+              un = "0000"
+              ln = hex_to_binary_dict[hex_string[2]]
+        if csv is not None:
+            csv.write("%s, %s, %s, %s, %s, %s, %s, %s, %s\n" % (x_origin + (i * x_increment), un[0], un[1], un[2], un[3], ln[0], ln[1], ln[2], ln[3], ))
+
+
+def decode_bulk(bin_input, buffer_size, x_origin, x_increment, csv):
+    """
+    The vectorized path now used by read_8bit_digital_data.
+    """
+    codes = bf.decode_digital_buffer(bin_input.read(buffer_size))
+    bits  = bf.unpack_digital(codes)
+    if csv is not None:
+        t = bf.time_axis(x_origin, x_increment, len(codes))
+        bf.write_csv_block(csv, "%s, %s\n", t, bf.DIGITAL_CSV_BITS[codes])
+
+
+def run(buffers, decoder, write_csv):
+    """
+    Decodes every buffer with the given decoder and returns the elapsed
+    wall time in seconds.
+    """
+    start = time.perf_counter()
+    for raw in buffers:
+        csv = io.StringIO() if write_csv else None
+        decoder(io.BytesIO(raw), len(raw), -1e-7, 2.5e-10, csv)
+
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    points   = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    rng     = np.random.default_rng(0)
+    buffers = [rng.integers(0, 256, points, dtype=np.uint8).tobytes() for i in range(segments)]
+    samples = segments * points
+
+    # Check that both paths produce the same csv text
+    a, b = io.StringIO(), io.StringIO()
+    decode_legacy(io.BytesIO(buffers[0]), points, -1e-7, 2.5e-10, a)
+    decode_bulk(io.BytesIO(buffers[0]), points, -1e-7, 2.5e-10, b)
+    assert a.getvalue() == b.getvalue()
+
+    print(f'{segments} segments x {points} points of 8-bit digital data')
+    for write_csv in (False, True):
+        t_legacy = run(buffers, decode_legacy, write_csv)
+        t_bulk   = run(buffers, decode_bulk, write_csv)
+        label    = 'decode + csv' if write_csv else 'decode only '
+        print(f'{label}: legacy {samples/t_legacy/1e6:7.2f} Msamples/s, '
+              f'vectorized {samples/t_bulk/1e6:7.2f} Msamples/s ({t_legacy/t_bulk:5.1f}x)')
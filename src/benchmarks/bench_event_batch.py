@@ -0,0 +1,97 @@
+# ====================
+# bench_event_batch.py
+# ====================
+#
+# Timing a whole run of 8-channel events (two scopes of 4 channels) held in
+# a RunDataset, with scope-like pulses as in bench_cfd.py:
+#   - one Event per segment (zero_baselines, calc_risetime_mtx), the
+#     processed Events kept with their waveforms dropped
+#   - EventBatch.from_dataset on the whole run block
+# and the memory held by the per-event results against the batch arrays.
+#
+# Usage: python bench_event_batch.py [events]
+
+
+import os
+import sys
+import io
+import time
+import contextlib
+import tracemalloc
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    from utils.timeaxis import TimeAxis
+    from models.dataset import RunDataset
+    from models.batch import EventBatch
+    from bench_cfd import pulse_block
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def synthetic_dataset(events, t):
+    """
+    Returns a RunDataset of pulses built in memory, without run files.
+    """
+    dataset = RunDataset.__new__(RunDataset)
+
+    dataset.dirpath        = ''
+    dataset.scope_config   = [('scope-1', 4), ('scope-2', 4)]
+    dataset.source         = 'synthetic'
+    dataset.data, _        = pulse_block(events, channels=8, t=t)
+    dataset.segments       = np.arange(1, events+1, dtype=np.int64)
+    dataset.x_origin       = np.full((events, 2), t.origin)
+    dataset.x_increment    = np.full((events, 2), t.increment)
+    dataset.timestamps     = np.full((events, 2), np.nan)
+    dataset.channel_labels = [(scope[0], ch) for scope in dataset.scope_config for ch in range(1, scope[1]+1)]
+
+    return dataset
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    t       = TimeAxis(-50, 0.1, 1000)
+    dataset = synthetic_dataset(events, t)
+    ROI     = (0, 40)
+
+    # One Event per segment, results kept as the Events themselves
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept  = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in dataset:
+            event.data = [row.copy() for row in event.data]
+            event.zero_baselines()
+            event.calc_risetime_mtx(ROI, 140, 0.3)
+            event.data          = None
+            event._derived      = {}
+            event._derived_rows = None
+            kept.append(event)
+    t_events   = time.perf_counter() - start
+    mem_events = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    batch   = EventBatch.from_dataset(dataset, ROI, 140, 0.3)
+    t_batch = time.perf_counter() - start
+
+    dt_events = np.array([event.dt_arr for event in kept])
+    diff      = np.nanmax(np.abs(dt_events - batch.dt[:len(batch)]))
+
+    print(f'{events} events x 8 channels')
+    print(f'Event per segment      : {events/t_events:8.0f} events/s, results {mem_events/2**20:6.2f} MiB')
+    print(f'EventBatch.from_dataset: {events/t_batch:8.0f} events/s, results {batch.nbytes/2**20:6.2f} MiB ({t_events/t_batch:4.1f}x)')
+    print(f'max |dt difference|    : {diff:.2e} ns')
@@ -0,0 +1,76 @@
+# ===================
+# bench_first_peak.py
+# ===================
+#
+# First-peak search on 8-channel events: the original get_first_peak
+# (smoothing the whole waveform, then cutting the ROI), the ROI-restricted
+# get_first_peak, and get_first_peaks on the whole (events x channels x
+# samples) block. Synthetic waveforms as in bench_baselines.py.
+#
+# Usage: python bench_first_peak.py [events] [roi_start] [roi_end]
+
+
+import os
+import sys
+import time
+import numpy as np
+import scipy
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    from bench_baselines import synthetic_block
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def get_first_peak_full(wf, threshold, ROI, sigma=2):
+    """
+    The original get_first_peak: smooths the whole waveform.
+    """
+    wf_sm  = scipy.ndimage.gaussian_filter1d(wf, sigma=sigma)
+    a = int(ROI[0]); b = int(ROI[1])
+    peaks  = scipy.signal.find_peaks(wf_sm[a:b], height=threshold, width=6, distance=10, prominence=12)
+    if len(peaks[0]):
+        return a + peaks[0][0], peaks[1]['peak_heights'][0]
+    return None, None
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ROI    = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (500, 700)
+
+    block = synthetic_block(events, clean=True)
+    rows  = block.reshape(-1, block.shape[-1])
+    fn.get_first_peaks(block[:1], 100, ROI)
+
+    start = time.perf_counter()
+    ref   = [get_first_peak_full(wf, 100, ROI) for wf in rows]
+    t_full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new   = [fn.get_first_peak(wf, 100, ROI) for wf in rows]
+    t_roi = time.perf_counter() - start
+
+    start = time.perf_counter()
+    peak_idx, peak_val = fn.get_first_peaks(block, 100, ROI)
+    t_batch = time.perf_counter() - start
+
+    same = all((r[0] is None and p == -1) or r[0] == p for r, p in zip(ref, peak_idx.ravel()))
+    same = same and all(r == n for r, n in zip(ref, new))
+
+    print(f'{events} events x {block.shape[1]} channels, ROI {ROI}, identical results: {same}')
+    print(f'full smoothing    : {events/t_full:7.0f} events/s')
+    print(f'ROI smoothing     : {events/t_roi:7.0f} events/s ({t_full/t_roi:4.1f}x)')
+    print(f'get_first_peaks   : {events/t_batch:7.0f} events/s ({t_full/t_batch:4.1f}x)')
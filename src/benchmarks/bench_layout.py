@@ -0,0 +1,67 @@
+# ===============
+# bench_layout.py
+# ===============
+#
+# Event.calc_risetime_mtx on detectors of 1 to N scopes of 4 channels (two
+# plates per scope), with scope-like pulses as in bench_cfd.py. The channel
+# to plate map (models.layout.DetectorLayout) is applied by fancy indexing,
+# so the time per channel should stay flat as scopes are added.
+#
+# Usage: python bench_layout.py [events] [max_scopes]
+
+
+import os
+import sys
+import io
+import time
+import contextlib
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    from utils.timeaxis import TimeAxis
+    from models.event import Event
+    from bench_cfd import pulse_block
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+if __name__ == '__main__':
+    events     = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_scopes = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    t = TimeAxis(-50, 0.1, 1000)
+
+    # Warm-up, so imports and first calls are not timed
+    with contextlib.redirect_stdout(io.StringIO()):
+        event       = Event('', 1, [('scope-1', 4)])
+        event.data  = list(pulse_block(1, channels=4, t=t)[0][0])
+        event.times = [t]
+        event.calc_risetime_mtx((0, 40), 140, 0.3)
+
+    for n_scopes in [1, 2, 4, max_scopes]:
+        scope_config = [(f'scope-{num+1}', 4) for num in range(n_scopes)]
+        block, _     = pulse_block(events, channels=4*n_scopes, t=t)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for wfs in block:
+                event       = Event('', 1, scope_config)
+                event.data  = list(wfs)
+                event.times = [t] * n_scopes
+                event.calc_risetime_mtx((0, 40), 140, 0.3)
+        t_run = time.perf_counter() - start
+
+        print(f'{n_scopes} scopes, {2*n_scopes:2d} plates: {events/t_run:6.0f} events/s, '
+              f'{t_run/events/(4*n_scopes)*1e6:6.1f} us per channel')
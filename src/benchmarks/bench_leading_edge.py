@@ -0,0 +1,97 @@
+# =====================
+# bench_leading_edge.py
+# =====================
+#
+# Leading-edge timing of 8-channel events: fn.get_risetime (an interp1d
+# object per waveform) against fn.leading_edge_times on the whole block.
+# Reports how often the two agree on noisy pulses. They differ where the
+# edge is not monotonic: get_risetime interpolates between the samples
+# nearest in voltage, which need not be neighbours in time, while
+# leading_edge_times takes the last crossing of the level before the peak.
+# On clean, monotonic edges the two definitions coincide, which is asserted.
+#
+# Usage: python bench_leading_edge.py [events] [fraction]
+
+
+import os
+import sys
+import time
+import numpy as np
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    from utils.timeaxis import TimeAxis
+    from bench_baselines import synthetic_block
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+if __name__ == '__main__':
+    events   = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+    block = synthetic_block(events, clean=True)
+    fn.find_baselines(block)
+
+    t   = TimeAxis(-50, 0.1, block.shape[-1])
+    ROI = (0, 20)
+    a   = fn.time_index(t, ROI[0])
+    b   = fn.time_index(t, ROI[1])
+    peak_idx, _ = fn.get_first_peaks(block, 100, (a, b))
+
+    rows  = block.reshape(-1, block.shape[-1])
+    peaks = peak_idx.ravel()
+
+    start = time.perf_counter()
+    ref   = np.full(len(rows), np.nan)
+    for num, (wf, p) in enumerate(zip(rows, peaks)):
+        if p < 0:
+            continue
+        try:
+            ref[num] = fn.get_risetime(t, wf, p, ROI, fraction=fraction)
+        except ValueError:
+            pass # level outside the pre-peak samples
+    t_interp = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new   = fn.leading_edge_times(block, t, peak_idx, a, fraction=fraction).ravel()
+    t_batch = time.perf_counter() - start
+
+    both  = np.isfinite(ref) & np.isfinite(new)
+    diff  = np.abs(ref - new)[both]
+    agree = (diff < 1e-9).mean()
+
+    print(f'{events} events x {block.shape[1]} channels, {both.sum()} timed pulses, fraction {fraction}')
+    print(f'get_risetime       : {events/t_interp:8.0f} events/s')
+    print(f'leading_edge_times : {events/t_batch:8.0f} events/s ({t_interp/t_batch:5.1f}x)')
+    print(f'identical times    : {agree:.1%}, |diff| p99 {np.percentile(diff, 99):.2g} ns, '
+          f'max {diff.max():.2g} ns, failures {np.isnan(ref[peaks >= 0]).sum()} / {np.isnan(new[peaks >= 0]).sum()}')
+
+    # Clean Gaussian pulses, searched from 4 widths before the peak: strictly
+    # rising edges, on which both definitions must give the same time
+    rng   = np.random.default_rng(1)
+    n     = block.shape[-1]
+    peak  = rng.integers(600, 900, 2000)
+    width = rng.uniform(2, 20, 2000)
+    amp   = rng.uniform(100, 500, 2000)
+    clean = amp[:, None] * np.exp(-0.5 * ((np.arange(n) - peak[:, None]) / width[:, None])**2)
+    first = peak - np.ceil(4 * width).astype(int)
+
+    ref = np.array([fn.get_risetime(t, wf, p, (t[a0], t[p]), fraction=fraction)
+                    for wf, p, a0 in zip(clean, peak, first)])
+    new = fn.leading_edge_times(clean, t, peak, first, fraction=fraction)
+
+    assert np.allclose(ref, new, rtol=0, atol=1e-9), 'leading_edge_times disagrees with get_risetime on a monotonic edge'
+    print(f'monotonic edges    : {len(clean)} pulses, max |diff| {np.abs(ref - new).max():.2g} ns')
@@ -0,0 +1,92 @@
+# =============================
+# bench_position_calibration.py
+# =============================
+#
+# dt -> x conversion of 4-plate events: the original calc_pos_arr (json read,
+# interp1d over a linspace and a loop over plates per event) against the
+# cached PositionCalibration, per event and on the whole (events x plates)
+# dt array at once.
+#
+# Usage: python bench_position_calibration.py [events]
+
+
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+from scipy.interpolate import interp1d
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    from utils.calibration import load_calibration
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def calc_pos_arr_interp(dt_arr, filepath, x_min=0, x_max=144, max_err=25):
+    """
+    The original Event.calc_pos_arr.
+    """
+    with open(filepath, 'r') as f:
+        popt = json.load(f)['popt']
+
+    x_vals = np.linspace(-100,244)
+    y_vals = popt[0]*x_vals + popt[1]
+    f_inv  = interp1d(y_vals, x_vals, kind='linear')
+
+    x_arr = np.full(len(dt_arr), np.nan)
+    for idx, dt in enumerate(dt_arr):
+        x = f_inv(dt)
+        if (x >= x_min) and (x <= x_max):
+            x_arr[idx] = x
+        elif (x < x_min) and (x > x_min - max_err):
+            x_arr[idx] = x_min
+        elif (x > x_max) and (x < x_max + max_err):
+            x_arr[idx] = x_max
+
+    return x_arr
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    rng = np.random.default_rng(0)
+    dt  = rng.uniform(-8, 8, (events, 4))
+    dt[rng.random(dt.shape) < 0.1] = np.nan
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, 't-x-conv.json')
+        with open(filepath, 'w') as f:
+            json.dump({'popt': [0.1, -7.0], 'pcov': [[1e-5, -6e-4], [-6e-4, 0.05]]}, f)
+
+        start   = time.perf_counter()
+        x_old   = np.array([calc_pos_arr_interp(row, filepath) for row in dt])
+        t_old   = time.perf_counter() - start
+
+        start   = time.perf_counter()
+        x_event = np.array([load_calibration(filepath).positions(row)[0] for row in dt])
+        t_event = time.perf_counter() - start
+
+        start    = time.perf_counter()
+        x_all, _ = load_calibration(filepath).positions(dt)
+        t_all    = time.perf_counter() - start
+
+    print(f'{events} events x 4 plates')
+    print(f'interp1d per event      : {events/t_old:10.0f} events/s')
+    print(f'calibration per event   : {events/t_event:10.0f} events/s ({t_old/t_event:6.1f}x)')
+    print(f'calibration, whole array: {events/t_all:10.0f} events/s ({t_old/t_all:6.1f}x)')
+    print(f'max |x difference|      : {np.nanmax(np.abs(x_old - x_all)):.2e} cm, '
+          f'same NaNs: {np.array_equal(np.isnan(x_old), np.isnan(x_all))}')
@@ -0,0 +1,94 @@
+# =================
+# bench_prefetch.py
+# =================
+#
+# Sequential segment scan over a csv run, as in delta_t.py and t-x-calib.py:
+# reading each Event then zeroing its baselines. Compares the plain
+# Event-per-segment loop with iter_events reading ahead in background
+# threads. An optional per-file delay (ms) mimics network-mounted storage.
+#
+# Usage: python bench_prefetch.py [segments] [delay_ms] [prefetch]
+
+
+import os
+import sys
+import time
+import tempfile
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    import utils.binfile as bf
+    import utils.convert as cv
+    from utils.cache import waveform_cache
+    from models.event import Event
+    from models.dataset import iter_events
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def scan_loop(run_path, scope_config):
+    seg = 1
+    while True:
+        try:
+            event = Event(run_path, seg, scope_config)
+            event.get_data()
+            event.zero_baselines()
+            seg += 1
+        except Exception:
+            break
+    return seg - 1
+
+
+def scan_prefetch(run_path, scope_config, prefetch):
+    n = 0
+    for event in iter_events(run_path, scope_config, prefetch=prefetch):
+        event.zero_baselines()
+        n += 1
+    return n
+
+
+if __name__ == '__main__':
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay    = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    prefetch = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    # Every pass must read the files, not the cache
+    waveform_cache.resize(0)
+
+    # Simulated storage latency per file read
+    read_waveform = fn.read_waveform
+    def delayed_read(*args):
+        time.sleep(delay * 1e-3)
+        return read_waveform(*args)
+    fn.read_waveform = delayed_read
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, 'scope-1-run0.bin')
+        bf.write_synthetic_bin(bin_path, segments=segments, channels=4, points=1000)
+        cv.convert_file(bin_path, tmp)
+
+        scope_config = [('scope-1-run0', 4)]
+
+        start = time.perf_counter()
+        n_loop = scan_loop(tmp, scope_config)
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_pref = scan_prefetch(tmp, scope_config, prefetch)
+        t_pref = time.perf_counter() - start
+
+        print(f'{segments} segments, {delay} ms simulated latency per file')
+        print(f'Event loop       : {n_loop} events, {t_loop/n_loop*1e3:6.3f} ms/event')
+        print(f'iter_events({prefetch:2d}) : {n_pref} events, {t_pref/n_pref*1e3:6.3f} ms/event ({t_loop/t_pref:4.1f}x)')
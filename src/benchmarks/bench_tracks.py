@@ -0,0 +1,74 @@
+# ===============
+# bench_tracks.py
+# ===============
+#
+# Straight-line track fits through 4 plate hits per event, some hits missing:
+# scipy.optimize.curve_fit event by event (as recon.py did) against the
+# closed-form utils.tracks.fit_tracks on the whole (events x plates) array.
+#
+# Usage: python bench_tracks.py [events]
+
+
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import scipy
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.tracks as tk
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+def linear(x, m, c):
+    return m*x + c
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    # Plates 43 cm apart, tracks within ~20 degrees of vertical, 5 cm resolution
+    rng       = np.random.default_rng(0)
+    plate_pos = np.array([43*4, 43*3, 43*2, 43*1], dtype=float)
+    slope     = np.tan(rng.normal(0, 0.35, events))
+    intercept = rng.uniform(20, 120, events)
+    x         = slope[:, None] * plate_pos + intercept[:, None] + rng.normal(0, 5, (events, 4))
+    x[rng.random(x.shape) < 0.1] = np.nan
+
+    # Events with two hits have no covariance estimate, as curve_fit warns
+    warnings.simplefilter('ignore', scipy.optimize.OptimizeWarning)
+
+    start = time.perf_counter()
+    m_ref = np.full(events, np.nan)
+    for k in range(events):
+        hit = np.isfinite(x[k])
+        if hit.sum() < 2:
+            continue
+        popt, _  = scipy.optimize.curve_fit(linear, plate_pos[hit], x[k][hit], p0=[-1, 100])
+        m_ref[k] = popt[0]
+    t_ref = time.perf_counter() - start
+
+    start = time.perf_counter()
+    m, c, cov, chi2 = tk.fit_tracks(x, plate_pos)
+    theta           = tk.zenith_angles(m)
+    t_run = time.perf_counter() - start
+
+    ok = np.isfinite(m_ref)
+    print(f'{events} events x 4 plates')
+    print(f'curve_fit per event: {t_ref*1e3:9.1f} ms')
+    print(f'fit_tracks         : {t_run*1e3:9.1f} ms ({t_ref/t_run:6.0f}x)')
+    print(f'max |slope difference|: {np.max(np.abs(m_ref[ok] - m[ok])):.1e}')
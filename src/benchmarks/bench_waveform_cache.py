@@ -0,0 +1,59 @@
+# =======================
+# bench_waveform_cache.py
+# =======================
+#
+# Repeated passes over the same csv run with Event.get_data, as the
+# calibration scripts do across parameter choices: the first pass parses
+# the csv files, later passes are served from the process-wide waveform
+# cache (utils.cache.waveform_cache).
+#
+# Usage: python bench_waveform_cache.py [segments] [passes]
+
+
+import os
+import sys
+import time
+import tempfile
+
+# Get current workding directory
+cwd = os.getcwd()
+
+# Get relative path of src directory
+src_path = cwd.split('/benchmarks')[0]
+
+# Add relative path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.binfile as bf
+    import utils.convert as cv
+    from utils.cache import waveform_cache
+    from models.event import Event
+except Exception as e:
+    print("Failed to import module packages. Check whether relative path to /src is correct:")
+    print(src_path)
+    print("From system error ==> ", e)
+
+
+if __name__ == '__main__':
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    passes   = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, 'scope-1-run0.bin')
+        bf.write_synthetic_bin(bin_path, segments=segments, channels=4, points=1000)
+        cv.convert_file(bin_path, tmp)
+
+        scope_config = [('scope-1-run0', 4)]
+        waveform_cache.clear()
+
+        for num in range(passes):
+            start = time.perf_counter()
+            for seg in range(1, segments + 1):
+                Event(tmp, seg, scope_config).get_data()
+            elapsed = time.perf_counter() - start
+
+            print(f'pass {num+1}: {elapsed/segments*1e3:6.3f} ms/event')
+
+        print(waveform_cache.stats())
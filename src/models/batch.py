@@ -0,0 +1,379 @@
+import os
+import sys
+import numpy as np
+
+# Get current working directory
+cwd        = os.getcwd()
+
+# Get relative path sci-muon_gesher/src
+src_path  = cwd.split('/models')[0]
+
+# Add src path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    from utils.timeaxis import TimeAxis
+    from utils.calibration import load_calibration
+    from models.layout import DetectorLayout
+    import utils.tracks as tk
+except:
+    print('Failure to import package modules. Check whether system path is correct:')
+    print(src_path)
+
+
+class EventBatch:
+    """
+    Results of many events held as struct-of-arrays: one preallocated array
+    per quantity, with the events along the first axis and the scintillator
+    plates (two channels each, see models.layout) along the second.
+
+        segments  (N,)           segment of each event, -1 if not filled
+        peak_idx  (N, plates, 2) first peak (or CFD ROI maximum) of each channel, -1 if none
+        peak_val  (N, plates, 2) smoothed waveform at each peak, NaN if none
+        risetimes (N, plates, 2) leading-edge or CFD time of each channel in ns
+        dt        (N, plates)    risetime difference of the two channels of a plate
+        x         (N, plates)    position on the plate, see EventBatch.positions
+        x_err     (N, plates)    uncertainty of each position
+
+    A batch timed at several fractions at once (see from_dataset) has a last
+    axis over them on risetimes, dt, x and x_err.
+
+    As in Event.calc_risetime_mtx, risetimes and dt are only set for plates on
+    which both channels have a peak and a risetime; peak_idx and peak_val are
+    the first peaks for leading-edge timing and the ROI maxima for CFD timing.
+    The memory used is fixed when the batch is created (see EventBatch.nbytes),
+    and histograms and fits run on whole columns at once.
+    batch[i] is a lightweight EventView of one event.
+    """
+    def __init__(self, scope_config, capacity, layout=None, levels=None):
+        """
+        Args:
+            scope_config (ndarray) : scopes and their number of channels, as for Event.
+                                     Example: [('scope-1-run8', 4),('scope-2-run8', 4)].
+            capacity (int)         : number of events the batch can hold
+            layout (DetectorLayout): channel to plate map, consecutive channel pairs
+                                     of each scope if None
+            levels (int)           : number of fractions each channel is timed at,
+                                     None for a single one (no fractions axis)
+        """
+        self.scope_config = list(scope_config)
+        self.layout       = layout if layout is not None else DetectorLayout(scope_config)
+        self.capacity     = int(capacity)
+        self.levels       = levels
+        self.size         = 0
+
+        # Run channel of both ends of each plate
+        self.plate_channels = self.layout.plate_channels
+        self.plates         = self.layout.n_plates
+
+        N = self.capacity
+        P = self.plates
+        F = () if levels is None else (int(levels),)
+        self.segments  = np.full(N, -1, dtype=np.int64)
+        self.peak_idx  = np.full((N, P, 2), -1, dtype=np.int64)
+        self.peak_val  = np.full((N, P, 2), np.nan)
+        self.risetimes = np.full((N, P, 2) + F, np.nan)
+        self.dt        = np.full((N, P) + F, np.nan)
+        self.x         = np.full((N, P) + F, np.nan)
+        self.x_err     = np.full((N, P) + F, np.nan)
+
+
+    # =========================================================
+    # Filling
+    # =========================================================
+
+    @classmethod
+    def from_dataset(cls, dataset, ROI, threshold, fraction, method='leading-edge', delay=2.0,
+                     baseline='peaks', chunk=1024, layout=None):
+        """
+        Times a whole RunDataset without creating an Event per segment. The
+        segments are processed chunk by chunk, each as one (segments x channels
+        x samples) block: baselines (fn.find_baselines or fn.robust_baselines),
+        first peaks (fn.get_first_peaks) and leading-edge times
+        (fn.leading_edge_times), or CFD times (fn.cfd_times, with the maximum
+        of each smoothed ROI as the peak), each in a single call. The results match Event.zero_baselines followed by
+        Event.calc_risetime_mtx event by event.
+
+        Args:
+            dataset (RunDataset) : the run
+            ROI (tuple)          : (start, end) of the region of interest in ns
+            threshold (float)    : minimum peak height in mV
+            fraction (float)     : fraction of the peak height defining the risetime,
+                                   or the CFD fraction. An array of fractions is timed
+                                   in one pass (leading-edge only), see EventBatch.levels.
+            method (str)         : 'leading-edge' or 'cfd'
+            delay (float)        : CFD delay in ns, for method='cfd'
+            baseline (str)       : 'peaks' or 'robust', as for Event.zero_baselines,
+                                   or None if the baselines are already zeroed
+            chunk (int)          : segments processed per block, bounding the
+                                   memory of the working copy
+            layout (DetectorLayout): channel to plate map, as for Event
+        Returns:
+            batch (EventBatch)
+        """
+        if method not in ('leading-edge', 'cfd'):
+            raise ValueError(f"Unknown timing method '{method}', expected 'leading-edge' or 'cfd'")
+        if baseline not in ('peaks', 'robust', None):
+            raise ValueError(f"Unknown baseline method '{baseline}', expected 'peaks', 'robust' or None")
+        if method == 'cfd' and np.ndim(fraction) != 0:
+            raise ValueError('The CFD times one fraction at a time, got an array of fractions')
+
+        levels = None if np.ndim(fraction) == 0 else np.size(fraction)
+        batch  = cls(dataset.scope_config, len(dataset), layout, levels)
+        batch.segments[:] = dataset.segments
+        batch.size        = len(dataset)
+
+        scope_of = batch.layout.channel_scope
+        n        = dataset.shape[-1]
+
+        # In sample units: the timing functions return fractional sample indices,
+        # turned into ns with the origin and increment of each segment and scope
+        unit = TimeAxis(0, 1, n)
+
+        for s0 in range(0, len(dataset), chunk):
+            s1    = min(s0 + chunk, len(dataset))
+            block = np.array(dataset.data[s0:s1], dtype=float)
+
+            if baseline == 'peaks':
+                fn.find_baselines(block)
+            elif baseline == 'robust':
+                fn.robust_baselines(block)
+
+            origin    = dataset.x_origin[s0:s1][:, scope_of]
+            increment = dataset.x_increment[s0:s1][:, scope_of]
+
+            # ROI sample indices of each waveform, as fn.time_index on its time axis
+            with np.errstate(invalid='ignore', divide='ignore'):
+                a = np.ceil((ROI[0] - origin) / increment - 0.5)
+                b = np.ceil((ROI[1] - origin) / increment - 0.5)
+            a = np.clip(np.nan_to_num(a), 0, n - 1).astype(int)
+            b = np.clip(np.nan_to_num(b), 0, n - 1).astype(int)
+
+            if method == 'cfd':
+                # Delay in samples of each waveform's own scope; the peaks are
+                # the maxima of the smoothed ROIs, without a peak search
+                idx, peaks, vals = fn.cfd_times(block, unit, (a, b), fraction=fraction,
+                                                delay=(delay / increment).ravel(), threshold=threshold,
+                                                return_peaks=True)
+            else:
+                peaks, vals = fn.get_first_peaks(block, threshold, (a, b))
+                idx         = fn.leading_edge_times(block, unit, peaks, a, fraction=fraction)
+
+            if levels is not None:
+                origin, increment = origin[..., None], increment[..., None]
+
+            batch.set_rows(slice(s0, s1), peaks, vals, origin + idx * increment)
+
+        return batch
+
+
+    def set_rows(self, rows, peaks, vals, times):
+        """
+        Fills events from per-channel results, pairing the channels into plates.
+
+        Args:
+            rows (slice/ndarray) : positions of the events in the batch
+            peaks (ndarray)      : (events x channels) first peak indices, -1 if none
+            vals (ndarray)       : (events x channels) peak heights
+            times (ndarray)      : (events x channels) risetimes in ns, with a
+                                   last axis over fractions if the batch has one
+        """
+        peaks = self.layout.plate_values(peaks)
+        vals  = self.layout.plate_values(vals)
+        times = self.layout.plate_values(times, axis=1)
+        found = (peaks != -1).all(axis=-1)
+        if self.levels is not None:
+            found = found[..., None]
+        both  = found & np.isfinite(times).all(axis=2)
+
+        self.peak_idx[rows]  = peaks
+        self.peak_val[rows]  = vals
+        self.risetimes[rows] = np.where(both[:, :, None], times, np.nan)
+        self.dt[rows]        = np.where(both, times[:, :, 0] - times[:, :, 1], np.nan)
+
+
+    def append(self, event):
+        """
+        Copies the results of an Event on which calc_risetime_mtx (and
+        optionally calc_pos_arr) has been run into the next free row. An Event
+        only keeps the peaks of plates timed on both channels (Event.dt_meta),
+        so the peaks of the other plates are left at -1.
+
+        Args:
+            event (Event) : the processed event
+        Returns:
+            i (int) : position of the event in the batch
+        """
+        if self.size == self.capacity:
+            raise IndexError(f'EventBatch is full ({self.capacity} events)')
+
+        i = self.size
+        self.segments[i]  = event.segment
+        self.risetimes[i] = event.risetime_matrix
+        self.dt[i]        = event.dt_arr
+        if event.x_arr is not None:
+            self.x[i]     = event.x_arr
+            self.x_err[i] = event.x_err_arr
+
+        # dt_meta holds (peak index, risetime) of both channels of each plate;
+        # the height is the smoothed waveform at the peak sample only
+        for plate, (ch1, ch2) in enumerate(self.plate_channels):
+            for side, ch in enumerate((ch1, ch2)):
+                p = event.dt_meta[plate][side][0]
+                if np.isfinite(p):
+                    self.peak_idx[i, plate, side] = int(p)
+                    self.peak_val[i, plate, side] = fn.smooth_roi(np.asarray(event.data[ch], dtype=float), int(p), int(p)+1)[0]
+
+        self.size += 1
+        return i
+
+
+    # =========================================================
+    # Derived quantities
+    # =========================================================
+
+    def positions(self, filepath, x_min=0, x_max=144, max_err=25):
+        """
+        Event.calc_pos_arr over all events: converts the whole dt array with
+        the PositionCalibration of the .json linear fit file in one call.
+
+        Args:
+            filepath (str)  : path to the .json linear fit file
+            x_min (float)   : plate start in cm
+            x_max (float)   : plate end in cm
+            max_err (float) : positions up to max_err outside the plate are
+                              clipped to its edge, further ones are NaN
+        Returns:
+            None
+            => Updates EventBatch.x and EventBatch.x_err
+        """
+        self.x, self.x_err = load_calibration(filepath).positions(self.dt, x_min, x_max, max_err)
+
+
+    def fit_tracks(self, heights, x_err=None):
+        """
+        Straight-line track fits through the positions of all events at once,
+        see utils.tracks.fit_tracks.
+
+        Args:
+            heights (ndarray) : height of each plate in cm
+            x_err (ndarray)   : position uncertainties in cm, for example
+                                EventBatch.x_err or a plate resolution.
+                                Unweighted if None.
+        Returns:
+            slope, intercept, cov, chi2 (ndarray) : one entry per event
+        """
+        if self.levels is not None:
+            raise ValueError('fit_tracks needs one position per plate, the batch holds '
+                             f'{self.levels} fractions: fit utils.tracks.fit_tracks on a '
+                             'slice such as batch.x[:len(batch), :, k]')
+
+        if x_err is not None:
+            x_err = np.broadcast_to(x_err, self.x.shape)[:self.size]
+
+        return tk.fit_tracks(self.x[:self.size], heights, x_err)
+
+
+    def histogram(self, bins, field='dt'):
+        """
+        Histograms a per-plate quantity of all events, every plate (and
+        fraction) in one pass. NaN entries (no peak, or off the plate) are left out.
+
+        Args:
+            bins (ndarray) : bin edges, as for np.histogram
+            field (str)    : 'dt' or 'x'
+        Returns:
+            counts (ndarray) : (plates x bins) counts, (plates x fractions x bins)
+                               for a batch timed at several fractions
+        """
+        bins   = np.asarray(bins, dtype=float)
+        nb     = len(bins) - 1
+        values = getattr(self, field)[:self.size]
+
+        # Bin of each value, the last edge included as in np.histogram
+        idx  = np.searchsorted(bins, values, side='right') - 1
+        idx  = np.where(values == bins[-1], nb - 1, idx)
+        keep = (idx >= 0) & (idx < nb) & np.isfinite(values)
+
+        # One histogram per plate (and fraction)
+        shape = values.shape[1:]
+        group = np.broadcast_to(np.arange(int(np.prod(shape))).reshape(shape), values.shape)
+        flat  = group[keep] * nb + idx[keep]
+
+        return np.bincount(flat, minlength=int(np.prod(shape)) * nb).reshape(shape + (nb,))
+
+
+    @property
+    def nbytes(self):
+        """Total size of the result arrays in bytes."""
+        return sum(arr.nbytes for arr in (self.segments, self.peak_idx, self.peak_val,
+                                          self.risetimes, self.dt, self.x, self.x_err))
+
+
+    # =========================================================
+    # Access
+    # =========================================================
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        """
+        batch[i] is a view of the i-th filled event.
+        """
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError(f'Event {i} out of range for EventBatch of {self.size} events')
+
+        return EventView(self, i)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield EventView(self, i)
+
+
+class EventView:
+    """
+    One event of an EventBatch, with the result names of Event. Holds only the
+    batch and the row: every attribute is a view into the batch arrays.
+    """
+    __slots__ = ('batch', 'i')
+
+    def __init__(self, batch, i):
+        self.batch = batch
+        self.i     = i
+
+    @property
+    def segment(self):
+        return int(self.batch.segments[self.i])
+
+    @property
+    def risetime_matrix(self):
+        """(plates x 2) risetimes in ns, (plates x 2 x fractions) for several fractions"""
+        return self.batch.risetimes[self.i]
+
+    @property
+    def peak_idx(self):
+        return self.batch.peak_idx[self.i]
+
+    @property
+    def peak_val(self):
+        return self.batch.peak_val[self.i]
+
+    @property
+    def dt_arr(self):
+        return self.batch.dt[self.i]
+
+    @property
+    def x_arr(self):
+        return self.batch.x[self.i]
+
+    @property
+    def x_err_arr(self):
+        return self.batch.x_err[self.i]
+
+    def __repr__(self):
+        return f'EventView(segment={self.segment}, dt={self.dt_arr})'
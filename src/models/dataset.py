@@ -0,0 +1,383 @@
+import os
+import sys
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Get current working directory
+cwd        = os.getcwd()
+
+# Get relative path sci-muon_gesher/src
+src_path  = cwd.split('/models')[0]
+
+# Add src path to system path
+sys.path.insert(0, src_path)
+
+# Import package modules
+try:
+    import utils.functions as fn
+    import utils.binfile as bf
+    import utils.store as st
+    from utils.timeaxis import TimeAxis
+    from models.event import Event
+    from utils.runindex import run_index
+except:
+    print('Failure to import package modules. Check whether system path is correct:')
+    print(src_path)
+
+
+class RunDataset:
+    """
+    A whole measurement run held as a single (segments x channels x samples)
+    waveform array, with the channels of all scopes in scope_config order and
+    the same conventions as Event.get_data (mV, negative pulses flipped,
+    times in ns). Samples missing in shorter waveforms are NaN.
+
+    Slicing a dataset by segments or channels returns another RunDataset, and
+    dataset.event(i) returns an Event whose data rows are views into the run
+    array, so batch algorithms and per-event code can share one load.
+    """
+    def __init__(self, dirpath, scope_config, source='store', segments=None, dtype=float):
+        """
+        Args:
+            dirpath (str)          : path to directory containing the run files
+            scope_config (ndarray) : scopes and their number of channels, as for Event.
+                                     Example: [('scope-1-run8', 4),('scope-2-run8', 4)].
+            source (str)           : 'store' for the <scope>.npz per-run stores,
+                                     'bin' for the raw <scope>.bin scope files,
+                                     'csv' for the converted csv files
+            segments (int)         : read only the first n segments, all if None
+            dtype (type)           : dtype of the waveform array, example: np.float32
+        """
+        self.dirpath      = dirpath
+        self.scope_config = list(scope_config)
+        self.source       = source
+
+        if source == 'csv':
+            self.load_csv(segments, dtype)
+        elif source in ('bin', 'store'):
+            self.load_mapped(source, segments, dtype)
+        else:
+            raise ValueError(f"Unknown dataset source '{source}', expected 'store', 'bin' or 'csv'")
+
+        self.channel_labels = [(scope[0], ch) for scope in self.scope_config for ch in range(1, scope[1]+1)]
+
+
+    # =========================================================
+    # Loading
+    # =========================================================
+
+    def allocate(self, n_segments, n_points, dtype):
+        """
+        Creates the empty run arrays for n_segments segments of n_points samples.
+        """
+        n_channels = sum(scope[1] for scope in self.scope_config)
+        n_scopes   = len(self.scope_config)
+
+        self.data        = np.full((n_segments, n_channels, n_points), np.nan, dtype=dtype)
+        self.x_origin    = np.full((n_segments, n_scopes), np.nan)
+        self.x_increment = np.full((n_segments, n_scopes), np.nan)
+        self.timestamps  = np.full((n_segments, n_scopes), np.nan)
+
+
+    def load_mapped(self, source, segments, dtype):
+        """
+        Loads the run from memory-mapped <scope>.bin files or <scope>.npz stores.
+        Only the segments present in every scope file are kept.
+        """
+        runfiles = []
+        for scope in self.scope_config:
+            if source == 'bin':
+                runfiles.append(bf.open_segmented(os.path.join(self.dirpath, f'{scope[0]}.bin')))
+            else:
+                runfiles.append(st.open_store(os.path.join(self.dirpath, f'{scope[0]}.npz')))
+
+        common = runfiles[0].segments
+        for runfile in runfiles[1:]:
+            common = np.intersect1d(common, runfile.segments)
+        self.segments = np.asarray(common[:segments], dtype=np.int64)
+
+        if source == 'bin':
+            n_points = max(int(runfile.table['points'].max()) for runfile in runfiles)
+        else:
+            n_points = max(runfile.data.shape[-1] for runfile in runfiles)
+        self.allocate(len(self.segments), n_points, dtype)
+
+        c0 = 0
+        for scope_idx, (scope, runfile) in enumerate(zip(self.scope_config, runfiles)):
+            channels = [str(ch) for ch in range(1, scope[1]+1)]
+
+            if source == 'store':
+                # Whole-block copy in one step: positions of our segments and channels
+                s_pos = np.array([runfile.seg_pos[int(seg)] for seg in self.segments], dtype=int)
+                c_pos = np.array([runfile.ch_pos[ch] for ch in channels], dtype=int)
+                block = runfile.get_block(s_pos, c_pos)
+                np.multiply(block, -1e3, out=self.data[:, c0:c0+len(channels), :block.shape[-1]], dtype=self.data.dtype, casting='unsafe')
+
+                self.x_origin[:, scope_idx]    = runfile.x_origin[s_pos, c_pos[-1]] * 1e9
+                self.x_increment[:, scope_idx] = runfile.x_increment[s_pos, c_pos[-1]] * 1e9
+                self.timestamps[:, scope_idx]  = runfile.time_tags[s_pos]
+            else:
+                for s, seg in enumerate(self.segments):
+                    for c, ch in enumerate(channels):
+                        wf = runfile.get_waveform(seg, ch)
+                        np.multiply(wf, -1e3, out=self.data[s, c0+c, :len(wf)], dtype=self.data.dtype, casting='unsafe')
+
+                    row = runfile.entry(seg, channels[-1])
+                    self.x_origin[s, scope_idx]    = row['x_origin'] * 1e9
+                    self.x_increment[s, scope_idx] = row['x_increment'] * 1e9
+                    self.timestamps[s, scope_idx]  = row['time_tag']
+
+            c0 += len(channels)
+
+
+    def load_csv(self, segments, dtype):
+        """
+        Loads the run from the converted <scope>_segment-<n>_<ch>.csv files,
+        reading the segments the run index lists for every scope.
+        """
+        segments = run_index(self.dirpath).segments(self.scope_config, 'csv')[:segments]
+
+        rows = []
+        for seg in segments:
+            row = self.read_csv_segment(seg, dtype)
+            if row is None:
+                break
+            rows.append(row)
+
+        self.segments = segments[:len(rows)]
+
+        n_points = max((len(wf) for waveforms, _ in rows for wf in waveforms), default=0)
+        self.allocate(len(rows), n_points, dtype)
+
+        for s, (waveforms, axes) in enumerate(rows):
+            for c, wf in enumerate(waveforms):
+                self.data[s, c, :len(wf)] = wf
+            for scope_idx, t in enumerate(axes):
+                self.x_origin[s, scope_idx]    = t.origin
+                self.x_increment[s, scope_idx] = t.increment
+
+        for scope_idx, scope in enumerate(self.scope_config):
+            info_path  = os.path.join(self.dirpath, f'{scope[0]}_info.txt')
+            timestamps = fn.get_timestamps(info_path, int(self.segments[-1])) if len(rows) else None
+            if timestamps is not None:
+                known = self.segments <= len(timestamps)
+                self.timestamps[known, scope_idx] = np.asarray(timestamps)[self.segments[known] - 1]
+
+
+    def read_csv_segment(self, segment, dtype):
+        """
+        Returns (waveforms, time axes) of one segment from the csv files of
+        every scope, or None if any of them has been removed since indexing.
+        """
+        waveforms = []
+        axes      = []
+        for scope in self.scope_config:
+            for ch in range(1, scope[1]+1):
+                csvfile = os.path.join(self.dirpath, f'{scope[0]}_segment-{segment}_{ch}.csv')
+                xy      = fn.get_waveform(csvfile, xignore=False, xconv=1e9, yconv=1e3, dtype=dtype)
+                if xy is None:
+                    return None
+                waveforms.append(xy[1])
+
+            # Time axis of the scope from the last channel read
+            axes.append(TimeAxis.from_array(xy[0]))
+
+        return waveforms, axes
+
+
+    # =========================================================
+    # Access
+    # =========================================================
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def __len__(self):
+        return len(self.segments)
+
+    def scope_channels(self):
+        """
+        Returns:
+            slices (list) : slice of the channel axis belonging to each scope
+        """
+        slices = []
+        c0 = 0
+        for scope in self.scope_config:
+            slices.append(slice(c0, c0 + scope[1]))
+            c0 += scope[1]
+
+        return slices
+
+    def time_axis(self, s, scope_idx):
+        """
+        Args:
+            s (int)         : position of the segment in the dataset
+            scope_idx (int) : position of the scope in scope_config
+        Returns:
+            t (TimeAxis) : sample times of the scope for that segment, in ns
+        """
+        return TimeAxis(self.x_origin[s, scope_idx], self.x_increment[s, scope_idx], self.data.shape[-1])
+
+    def position(self, segment):
+        """
+        Args:
+            segment (int) : segment index, as numbered by the scope
+        Returns:
+            s (int) : position of the segment in the dataset
+        """
+        s = np.searchsorted(self.segments, int(segment))
+        if s == len(self.segments) or self.segments[s] != int(segment):
+            raise KeyError(f'No segment {segment} in dataset of {self.dirpath}')
+
+        return int(s)
+
+    def select(self, segments=slice(None), channels=None):
+        """
+        Restricts the dataset to a range of segments and/or a subset of channels.
+        Segment slices and whole-scope channel selections are views; channel
+        subsets within a scope are copied, as numpy fancy indexing always is.
+
+        Args:
+            segments (slice/ndarray) : positions of the segments to keep
+            channels (list)          : (scope name, channel) labels to keep, in the
+                                       order given, all channels if None.
+                                       Example: [('scope-1-run8', 1), ('scope-1-run8', 2)]
+        Returns:
+            subset (RunDataset)
+        """
+        subset = RunDataset.__new__(RunDataset)
+        subset.__dict__.update(self.__dict__)
+
+        if isinstance(segments, (int, np.integer)):
+            segments = slice(segments, segments+1 or None)
+
+        subset.segments    = self.segments[segments]
+        subset.data        = self.data[segments]
+        subset.x_origin    = self.x_origin[segments]
+        subset.x_increment = self.x_increment[segments]
+        subset.timestamps  = self.timestamps[segments]
+
+        if channels is None:
+            return subset
+
+        channels = [(str(scope), int(ch)) for scope, ch in channels]
+        missing  = [label for label in channels if label not in self.channel_labels]
+        if missing:
+            raise KeyError(f'Channels {missing} are not in the dataset')
+
+        # Keep scopes that still have channels, in the original scope order
+        scope_names = [scope[0] for scope in self.scope_config]
+        scope_keep  = [idx for idx, name in enumerate(scope_names) if any(label[0] == name for label in channels)]
+        channels    = sorted(channels, key=lambda label: scope_names.index(label[0]))
+        c_pos       = [self.channel_labels.index(label) for label in channels]
+
+        if c_pos == list(range(c_pos[0], c_pos[-1]+1)):
+            subset.data = subset.data[:, c_pos[0]:c_pos[-1]+1]
+        else:
+            subset.data = subset.data[:, c_pos]
+
+        subset.scope_config   = [(scope_names[idx], sum(label[0] == scope_names[idx] for label in channels)) for idx in scope_keep]
+        subset.channel_labels = channels
+        subset.x_origin       = subset.x_origin[:, scope_keep]
+        subset.x_increment    = subset.x_increment[:, scope_keep]
+        subset.timestamps     = subset.timestamps[:, scope_keep]
+
+        return subset
+
+    def __getitem__(self, key):
+        """
+        dataset[i] is the Event of the i-th segment in the dataset, dataset[a:b]
+        the dataset of those segments.
+        """
+        if isinstance(key, (int, np.integer)):
+            return self.event(key)
+
+        return self.select(segments=key)
+
+    def __iter__(self):
+        for s in range(len(self)):
+            yield self.event(s)
+
+    def event(self, s):
+        """
+        Args:
+            s (int) : position of the segment in the dataset
+        Returns:
+            event (Event) : the segment as an Event with data and times already
+                            set; data rows are views into the run array
+        """
+        if s < 0:
+            s += len(self)
+        event = Event(self.dirpath, int(self.segments[s]), self.scope_config)
+
+        event.data  = list(self.data[s])
+        event.times = [self.time_axis(s, scope_idx) for scope_idx in range(len(self.scope_config))]
+
+        return event
+
+
+# =========================================================
+# Sequential segment scans
+# =========================================================
+
+def load_event(dirpath, segment, scope_config, source='csv'):
+    """
+    Returns the Event of a segment with its data loaded.
+    """
+    event = Event(dirpath, segment, scope_config)
+    event.get_data(source)
+
+    return event
+
+
+def iter_events(run_path, scope_config, prefetch=4, source='csv', start=1, stop=None):
+    """
+    Yields the Events of the segments of a run with their data loaded, in
+    order. The segments are taken from the run index (see utils.runindex), so
+    exactly the segments present for every scope are visited and no reads are
+    attempted past the end of the run. A pool of prefetch threads reads the
+    following segments while the current one is being analysed, hiding the
+    file I/O latency of slow (network) storage.
+
+    Args:
+        run_path (str)         : path to directory containing the run files
+        scope_config (ndarray) : scopes and their number of channels, as for Event
+        prefetch (int)         : number of segments read ahead, 0 to read in the
+                                 calling thread only
+        source (str)           : 'csv', 'bin' or 'store', as for Event.get_data
+        start (int)            : first segment
+        stop (int)             : last segment, the last available one if None
+    Yields:
+        event (Event)
+    """
+    segments = run_index(run_path).segments(scope_config, source)
+    segments = segments[segments >= start]
+    if stop is not None:
+        segments = segments[segments <= stop]
+    segments = iter(segments.tolist())
+
+    if prefetch <= 0:
+        for seg in segments:
+            yield load_event(run_path, seg, scope_config, source)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    pending  = deque()
+    try:
+        for seg in itertools.islice(segments, prefetch + 1):
+            pending.append(executor.submit(load_event, run_path, seg, scope_config, source))
+
+        while pending:
+            event = pending.popleft().result()
+
+            # Keep the read-ahead window full
+            seg = next(segments, None)
+            if seg is not None:
+                pending.append(executor.submit(load_event, run_path, seg, scope_config, source))
+
+            yield event
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
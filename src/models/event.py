@@ -1,8 +1,7 @@
 import os
 import sys
 import numpy as np
-import json
-from scipy.interpolate import interp1d
+import scipy
 
 # Get current working directory
 cwd        = os.getcwd()
@@ -16,6 +15,12 @@ sys.path.insert(0, src_path)
 # Import package modules
 try:
     import utils.functions as fn
+    import utils.binfile as bf
+    import utils.store as st
+    from utils.timeaxis import TimeAxis
+    from utils.runindex import run_index
+    from utils.calibration import load_calibration
+    from models.layout import DetectorLayout
 except:
     print('Failure to import package modules. Check whether system path is correct:')
     print(src_path)
@@ -26,7 +31,7 @@ class Event:
     Event object containig all measured data and metadata from a 
     triggered scope event, together with derived values and properties.
     """
-    def __init__(self, dirpath, segment, scope_config):
+    def __init__(self, dirpath, segment, scope_config, layout=None):
         """
         Args:
             dirpath (str)          : path to directory containing the data csv files
@@ -36,24 +41,33 @@ class Event:
                                      the second element contains the associated number of
                                      channels for that scope.
                                      Example: [('scope-1-run8', 4),('scope-2-run8', 4)].
+            layout (DetectorLayout): channel to plate map, consecutive channel pairs
+                                     of each scope if None
         """
         self.dirpath      = dirpath
         self.segment      = segment
         self.scope_config = scope_config
+        self.layout       = layout if layout is not None else DetectorLayout(scope_config)
 
         self.risetime_matrix = None
         self.dt_arr          = None
         self.x_arr           = None
+        self.x_err_arr       = None
+
+        # Cache of arrays derived from self.data (see Event.derived)
+        self._derived      = {}
+        self._derived_rows = None
 
         # Structure risetime and dt matrices
         self.struct_risetime_matrix()
 
     def struct_risetime_matrix(self):
         """
-        Given self.scope_config, this function create an np.nan numpy matrix
+        Given self.layout, this function create an np.nan numpy matrix
         in the shape of the experiment. For example, scope_config = [('scope-1', 4),('scope-2',4)]
         means that there are two scopes with 4 channels each, which in turn means two scintillator
-        plates per scope. The matrix shape will then be ((4, 2)).
+        plates per scope. The matrix shape will then be ((4, 2)): one row per plate, one column
+        per plate end. Any number of scopes and plates is supported (see models.layout).
 
         Args:
             None
@@ -61,160 +75,337 @@ class Event:
             None
             => Updates self.risetime_mtx.
         """
-        if len(self.scope_config) == 2:
-            matrix = [[],[]]
-        elif len(self.scope_config) == 1:
-            matrix = [[]]
-
-        dt_len = 0
-
-        for num, scope in enumerate(matrix):
-            ch_num = self.scope_config[num][1]
-            plate_num = int(ch_num/2)
-            for plate in range(plate_num):
-                matrix[num].append([np.nan, np.nan])
-                dt_len += 1
-
-        risetime_matrix = np.array(matrix)
-        dt_arr       = np.empty(dt_len)
-        dt_arr[:]    = np.nan
-
-        self.risetime_matrix = risetime_matrix
-        self.dt_arr       = dt_arr
+        self.risetime_matrix = np.full((self.layout.n_plates, 2), np.nan)
+        self.dt_arr          = np.full(self.layout.n_plates, np.nan)
 
 
-    def get_data(self):
+    def get_data(self, source='csv'):
         """
         Extracts the waveforms and time data from a given triggered event, or segment.
-        The function adds self.data and self.time attributes to the event object.
+        The function adds self.data and self.times attributes to the event object.
+        self.times holds one TimeAxis (in ns) per scope, which acts as the array of
+        sample times but only stores (origin, increment, points).
 
         Args:
-            None
+            source (str) : 'csv' to read the converted <scope>_segment-<n>_<ch>.csv files,
+                           'bin' to read the segment directly from the raw <scope>.bin
+                           scope file in self.dirpath, without any conversion step,
+                           'store' to read it from the <scope>.npz per-run store.
         Returns:
             None
+        Raises:
+            FileNotFoundError : if the segment is not in the run for every scope
+                                (for example past the last segment)
         """
+        if not run_index(self.dirpath).has_segment(self.segment, self.scope_config, source):
+            raise FileNotFoundError(f"Segment {self.segment} of {[scope[0] for scope in self.scope_config]} "
+                                    f"not found in {self.dirpath} (source '{source}')")
+
+        if source in ('bin', 'store'):
+            self.get_data_mapped(source)
+            return
+
         data  = [] # store waveform matrix
         times = [] # store time axis for each scope as they can be different
         for scope in self.scope_config:
+            xy = None
             for ch in range(1, scope[1]+1):
+                # Only the last channel's time column is parsed, for the scope's time axis
+                last = ch == scope[1]
                 try:
                     csvfile = os.path.join(self.dirpath, f'{scope[0]}_segment-{self.segment}_{ch}.csv')
-                    wf      = fn.get_waveform(csvfile, yconv=1e3)
+                    if last == True:
+                        xy = fn.get_waveform(csvfile, xignore=False, xconv=1e9, yconv=1e3)
+                        wf = xy[1]
+                    else:
+                        wf = fn.get_waveform(csvfile, yconv=1e3)
                 except Exception as e:
                     print('Failed to get waveform from csv file. Error:')
                     print(e)
                     wf      = [np.nan]
                 data.append(wf)
 
-            wf = fn.get_waveform(csvfile, xignore=False, xconv=1e9)
-            t  = wf[0]
+            # Time axis of the scope from its last channel
+            if xy is None:
+                raise ValueError(f'No time axis for {scope[0]} segment {self.segment}: '
+                                 f'channel {scope[1]} could not be read')
+            t = TimeAxis.from_array(xy[0])
             times.append(t)
 
         self.data  = data
         self.times = times
 
 
-    def zero_baselines(self):
+    def get_data_mapped(self, source):
         """
-        <Decription>
+        Same as get_data, but reads the waveforms from memory-mapped <scope>.bin
+        files or <scope>.npz run stores. Each file is opened once per process,
+        after which each segment is a direct lookup into the mapped file.
 
         Args:
+            source (str) : 'bin' or 'store'
+        Returns:
+            None
+        """
+        data  = [] # store waveform matrix
+        times = [] # store time axis for each scope as they can be different
+        for scope in self.scope_config:
+            if source == 'bin':
+                runfile = bf.open_segmented(os.path.join(self.dirpath, f'{scope[0]}.bin'))
+            else:
+                runfile = st.open_store(os.path.join(self.dirpath, f'{scope[0]}.npz'))
+
+            for ch in range(1, scope[1]+1):
+                try:
+                    # Same conventions as the csv path: mV and negative pulses flipped
+                    wf = np.multiply(runfile.get_waveform(self.segment, ch), -1e3, dtype=float)
+                except Exception as e:
+                    print(f'Failed to get waveform from {source} file. Error:')
+                    print(e)
+                    wf = [np.nan]
+                data.append(wf)
+
+            t = runfile.get_time_axis(self.segment, ch).scaled(1e9)
+            times.append(t)
+
+        self.data  = data
+        self.times = times
+
+
+    # =========================================================
+    # Derived arrays
+    # =========================================================
 
+    def derived(self, key, compute):
+        """
+        Per-event cache of arrays derived from self.data (smoothed waveforms,
+        baselines, first peaks), so each is computed at most once per parameter
+        set. The cache is dropped as soon as any waveform in self.data is
+        replaced, as get_data, zero_baselines or `data[i] = data[i] - bl` do.
+        Waveforms edited in place are not noticed, replace them instead.
+
+        Args:
+            key (tuple)        : name and parameters of the derived array
+            compute (function) : called without arguments to compute it on a miss
         Returns:
+            value : the cached or newly computed value
+        """
+        rows = self.data
+        if (self._derived_rows is None or len(rows) != len(self._derived_rows)
+                or any(row is not old for row, old in zip(rows, self._derived_rows))):
+            self._derived      = {}
+            self._derived_rows = list(rows)
+
+        if key not in self._derived:
+            self._derived[key] = compute()
 
+        return self._derived[key]
+
+    def smoothed(self, sigma):
         """
-        for num, row in enumerate(self.data):
-            bl = fn.find_baseline(row)[0]
-            wf = row - bl
-            self.data[num] = wf
+        Args:
+            sigma (float) : Gaussian smoothing width in samples
+        Returns:
+            smoothed (list) : smoothed copy of each waveform in self.data
+        """
+        def compute():
+            if len(set(len(row) for row in self.data)) == 1:
+                return list(scipy.ndimage.gaussian_filter1d(np.array(self.data, dtype=float), sigma=sigma, axis=-1))
+            return [scipy.ndimage.gaussian_filter1d(np.asarray(row, dtype=float), sigma=sigma) for row in self.data]
+
+        return self.derived(('smoothed', sigma), compute)
+
+    def baselines(self, width=6, distance=12, prominence=12, roundto=2, sigma=0.75):
+        """
+        Baselines of all waveforms, as fn.find_baseline gives them, computed with
+        fn.find_baselines from the cached smoothed waveforms.
+
+        Args:
+            see fn.find_baseline
+        Returns:
+            baseline_mean (ndarray) : baseline of each waveform
+            baseline_std (ndarray)  : standard deviation of each baseline
+            masks (list)            : bool mask of each waveform, True outside the baseline
+        """
+        def compute():
+            smoothed = self.smoothed(sigma)
+            if len(set(len(row) for row in self.data)) == 1:
+                mean, std, mask = fn.find_baselines(np.array(self.data, dtype=float), width=width, distance=distance,
+                                                    prominence=prominence, roundto=roundto, subtract=False,
+                                                    smoothed=np.array(smoothed), return_mask=True)
+                return mean, std, list(mask)
+
+            results = [fn.find_baselines(np.asarray(row, dtype=float), width=width, distance=distance,
+                                         prominence=prominence, roundto=roundto, subtract=False,
+                                         smoothed=sm, return_mask=True) for row, sm in zip(self.data, smoothed)]
+            return (np.array([r[0] for r in results]), np.array([r[1] for r in results]),
+                    [r[2] for r in results])
+
+        return self.derived(('baselines', width, distance, prominence, roundto, sigma), compute)
+
+
+    def zero_baselines(self, method='peaks'):
+        """
+        Subtracts the baseline of each waveform in self.data. Waveforms of equal
+        length are handled together in one batch; the original arrays are left
+        untouched (they may be cached or views into a RunDataset).
+
+        Args:
+            method (str) : 'peaks' to mask the peaks of the smoothed waveform
+                           (fn.find_baselines), 'robust' for the cheaper
+                           pre-trigger median/MAD estimate (fn.robust_baselines),
+                           which falls back to 'peaks' on pile-up
+        Returns:
+            None
+            => Updates self.data.
+        """
+        if method not in ('peaks', 'robust'):
+            raise ValueError(f"Unknown baseline method '{method}', expected 'peaks' or 'robust'")
 
+        if method == 'robust' and len(set(len(row) for row in self.data)) == 1:
+            block = np.array(self.data, dtype=float)
+            fn.robust_baselines(block)
+            self.data = list(block)
+            return
 
-    def calc_risetime_mtx(self, ROI, threshold, fraction): # would all be self.<property>
+        baseline_mean = self.baselines()[0]
+        self.data = [row - bl for row, bl in zip(self.data, baseline_mean)]
+
+
+    def calc_risetime_mtx(self, ROI, threshold, fraction, method='leading-edge', delay=2.0): # would all be self.<property>
         """
         Calculates the risetime of each peak on each scintillator plate, if it exists.
+        A plate is timed when both of its channels have a first peak and a risetime.
+        The first peaks and the leading-edge times of all channels are each found
+        in one batched call (fn.get_first_peaks, fn.leading_edge_times), or all
+        channels are timed by a constant-fraction discriminator (fn.cfd_times),
+        which needs no peak search; dt_meta then holds the maximum of each
+        channel's smoothed ROI as its peak.
 
         Args:
-            
+            ROI (tuple)       : (start, end) of the region of interest in ns
+            threshold (float) : minimum peak height in mV
+            fraction (float/ndarray) : fraction of the peak height defining the risetime,
+                                       or the CFD fraction. An array of fractions is
+                                       timed in one pass (leading-edge only), adding a
+                                       last axis over them to risetime_matrix
+                                       (plates x 2 x fractions) and dt_arr (plates x
+                                       fractions); a plate is then timed per fraction.
+            method (str)      : 'leading-edge' or 'cfd'
+            delay (float)     : CFD delay in ns, for method='cfd'
         Returns:
             None
             => Updates self.risetime_mtx and self.dt_arr property.
         """
-        dt_meta = []
-        wf_idx = 0
-        for scope_idx, scope in enumerate(self.risetime_matrix):
-            t = self.times[scope_idx]
-            a = np.argmin(np.abs(t - ROI[0]))
-            b = np.argmin(np.abs(t - ROI[1]))
+        # ROI sample indices of each scope, then of each channel
+        scope_ROIs = []
+        for t in self.times:
+            a = fn.time_index(t, ROI[0])
+            b = fn.time_index(t, ROI[1])
             ROI_idx = (a,b)
             print(ROI_idx)
-            for plate_idx, plate in enumerate(scope):
-                wf1 = self.data[wf_idx]
-                wf2 = self.data[wf_idx+1]
+            scope_ROIs.append(ROI_idx)
+
+        channel_scope = self.layout.channel_scope
+        row_ROIs      = [scope_ROIs[s] for s in channel_scope]
+
+        # Times of all channels at once, each with its scope's time axis
+        row_times = [self.times[s] for s in channel_scope]
+
+        if method not in ('leading-edge', 'cfd'):
+            raise ValueError(f"Unknown timing method '{method}', expected 'leading-edge' or 'cfd'")
+        if method == 'cfd' and np.ndim(fraction) != 0:
+            raise ValueError('The CFD times one fraction at a time, got an array of fractions')
+
+        if method == 'cfd':
+            # No peak search: the peak kept in dt_meta is the maximum of the
+            # smoothed ROI, which cfd_times has at hand
+            ROI_arr = np.array(row_ROIs, dtype=int).reshape(-1, 2)
+            risetimes, peaks, _ = fn.cfd_times(self.data_block(), row_times, (ROI_arr[:, 0], ROI_arr[:, 1]),
+                                               fraction=fraction, delay=delay, threshold=threshold,
+                                               return_peaks=True)
+        else:
+            peaks     = self.first_peaks(row_ROIs, threshold)
+            risetimes = fn.leading_edge_times(self.data_block(), row_times, peaks,
+                                              [ROI_idx[0] for ROI_idx in row_ROIs], fraction=fraction)
+
+        # Both ends of every plate at once, the channel axis indexed explicitly
+        # as risetimes may have a last axis over fractions
+        risetimes   = np.asarray(risetimes, dtype=float)
+        plate_peaks = self.layout.plate_values(np.asarray(peaks))
+        plate_times = self.layout.plate_values(risetimes, axis=0)
+        has_peaks   = (plate_peaks != -1).all(axis=-1).reshape((-1,) + (1,) * (risetimes.ndim - 1))
+        both        = has_peaks & np.isfinite(plate_times).all(axis=1)
+
+        self.risetime_matrix = np.where(both[:, None], plate_times, np.nan)
+        self.dt_arr          = np.where(both, plate_times[:, 0] - plate_times[:, 1], np.nan)
+
+        # A plate is kept in dt_meta if it is timed at any fraction
+        found   = both.reshape(len(both), -1).any(axis=-1)
+        tup_nan = (np.nan, np.nan)
+        dt_meta = [[(p1, rt1), (p2, rt2)] if timed else [tup_nan, tup_nan]
+                   for (p1, p2), (rt1, rt2), timed in zip(plate_peaks.tolist(), self.risetime_matrix.tolist(), found)]
 
-                p1, _ = fn.get_first_peak(wf1, threshold=threshold, ROI=ROI_idx)
-                p2, _ = fn.get_first_peak(wf2, threshold=threshold, ROI=ROI_idx)
+        self.dt_meta = dt_meta
 
 
+    def data_block(self):
+        """
+        Returns:
+            block (ndarray) : self.data as a (channels x samples) float array,
+                              shorter waveforms padded with NaN
+        """
+        n     = max(len(row) for row in self.data)
+        block = np.full((len(self.data), n), np.nan)
+        for num, row in enumerate(self.data):
+            block[num, :len(row)] = row
 
-                if p1 and p2 != None:
-                    fraction  = fraction
-                    rt1 = fn.get_risetime(t, wf1, p1, ROI, fraction=fraction)
-                    rt2 = fn.get_risetime(t, wf2, p2, ROI, fraction=fraction)
+        return block
 
-                    self.risetime_matrix[scope_idx][plate_idx][0] = rt1
-                    self.risetime_matrix[scope_idx][plate_idx][1] = rt2
+    def first_peaks(self, row_ROIs, threshold):
+        """
+        Args:
+            row_ROIs (list)   : (a, b) ROI sample indices of each waveform in self.data
+            threshold (float) : minimum peak height in mV
+        Returns:
+            peak_idx (list) : index of the first peak of each waveform, -1 if none
+        """
+        # Only the window covering the ROIs is smoothed (see fn.smooth_roi)
+        def compute():
+            if len(set(len(row) for row in self.data)) == 1:
+                ROI_arr = np.array(row_ROIs, dtype=int).reshape(-1, 2)
+                peak_idx, _ = fn.get_first_peaks(np.array(self.data, dtype=float), threshold,
+                                                 (ROI_arr[:, 0], ROI_arr[:, 1]))
+                return [int(p) for p in peak_idx]
 
-                    tup1 = (p1, rt1)
-                    tup2 = (p2, rt2)
+            # Waveforms of different lengths (for example a failed read): one at a time
+            peak_idx = []
+            for row, ROI_idx in zip(self.data, row_ROIs):
+                p, _ = fn.get_first_peaks(row, threshold, ROI_idx)
+                peak_idx.append(int(p))
 
-                    dt = rt1 - rt2
-                    self.dt_arr[int(wf_idx/2)] = dt
-                    dt_meta.append([tup1, tup2])
-                else:
-                    tup_nan = (np.nan, np.nan)
-                    dt_meta.append([tup_nan, tup_nan])
+            return peak_idx
 
-                wf_idx += 2
-        
-        self.dt_meta = dt_meta
+        key = ('first_peaks', threshold, tuple((int(a), int(b)) for a, b in row_ROIs))
+        return list(self.derived(key, compute))
 
 
     def calc_pos_arr(self, filepath, x_min=0, x_max=144, max_err=25):
         """
         Using .json linear fit file, converts dt array to position array.
+        The calibration is loaded once per file (utils.calibration.load_calibration)
+        and inverted analytically for all plates at once.
 
         Args:
-
+            filepath (str)  : path to the .json linear fit file
+            x_min (float)   : plate start in cm
+            x_max (float)   : plate end in cm
+            max_err (float) : positions up to max_err outside the plate are
+                              clipped to its edge, further ones are NaN
         Returns:
             None
-            => Creates or updates Event.pos_arr property. 
+            => Creates or updates Event.x_arr and Event.x_err_arr properties.
         """
-        with open(filepath, 'r') as f:
-            popt = json.load(f)['popt']
-            #popt    = content['popt']
-        
-        # Linear function
-        def linear(x, m, c):
-            return m*x + c
-
-        # Generate linear array
-        x_vals = np.linspace(-100,244)
-        y_vals = linear(x_vals, *popt)
-
-        f_inv = interp1d(y_vals, x_vals, kind='linear')
-
-        # Create the position array
-        x_arr = np.empty(len(self.dt_arr))
-        x_arr[:] = np.nan
-
-        for idx, dt in enumerate(self.dt_arr):
-            x = f_inv(dt)
-            if (x >= x_min) and (x <= x_max):
-                x_arr[idx] = x
-            elif (x < x_min) and (x > x_min - max_err):
-                x_arr[idx] = x_min
-            elif (x > x_max) and (x < x_max + max_err):
-                x_arr[idx] = x_max
-
-        self.x_arr = x_arr
+        calib = load_calibration(filepath)
 
+        self.x_arr, self.x_err_arr = calib.positions(self.dt_arr, x_min, x_max, max_err)
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class DetectorLayout:
+    """
+    Map of the scope channels onto the scintillator plates: each plate is read
+    out at both ends, end 0 and end 1, by one channel each, and its dt is the
+    risetime of end 0 minus that of end 1. The map is compiled into index
+    arrays over the channels of all scopes in scope_config order (the rows of
+    Event.data), so per-plate values are taken from per-channel arrays with a
+    single fancy index, whatever the number of scopes and plates.
+    """
+    def __init__(self, scope_config, plates=None):
+        """
+        Args:
+            scope_config (ndarray) : scopes and their number of channels, as for Event.
+                                     Example: [('scope-1-run8', 4),('scope-2-run8', 4)].
+            plates (list)          : ((scope, channel), (scope, channel)) of end 0 and
+                                     end 1 of each plate, top plate first. If None,
+                                     consecutive channels of each scope make a plate
+                                     (1-2, 3-4, ...), as wired in the lab.
+                                     Example: [(('scope-1-run8', 1), ('scope-1-run8', 2)), ...]
+        """
+        self.scope_config = list(scope_config)
+
+        self.channel_labels = [(scope[0], ch) for scope in self.scope_config for ch in range(1, scope[1]+1)]
+        self.channel_scope  = np.array([num for num, scope in enumerate(self.scope_config) for ch in range(scope[1])], dtype=int)
+
+        if plates is None:
+            plates = [((scope[0], ch), (scope[0], ch+1)) for scope in self.scope_config
+                      for ch in range(1, scope[1], 2)]
+
+        position = {label: num for num, label in enumerate(self.channel_labels)}
+        channels = []
+        for ends in plates:
+            try:
+                channels.append([position[(str(scope), int(ch))] for scope, ch in ends])
+            except KeyError as e:
+                raise KeyError(f'Plate channel {e} is not in scope_config {self.scope_config}')
+
+        self.plate_channels = np.array(channels, dtype=int).reshape(-1, 2)
+        if len(np.unique(self.plate_channels)) != self.plate_channels.size:
+            raise ValueError('A channel is assigned to more than one plate end')
+
+        # Inverse map: plate and end of each channel, -1 if not read out
+        self.channel_plate = np.full(len(self.channel_labels), -1, dtype=int)
+        self.channel_end   = np.full(len(self.channel_labels), -1, dtype=int)
+        self.channel_plate[self.plate_channels] = np.arange(len(self.plate_channels))[:, None]
+        self.channel_end[self.plate_channels]   = np.arange(2)[None, :]
+
+        # Scope of both ends of each plate
+        self.plate_scope = self.channel_scope[self.plate_channels]
+
+    @property
+    def n_channels(self):
+        return len(self.channel_labels)
+
+    @property
+    def n_plates(self):
+        return len(self.plate_channels)
+
+    def plate_values(self, values, axis=-1):
+        """
+        Args:
+            values (ndarray) : per-channel values along axis, any other axes
+            axis (int)       : the channel axis, for example -2 for
+                               (channels x fractions) risetimes
+        Returns:
+            plate_values (ndarray) : the values of both ends of each plate, the
+                                     channel axis replaced by (plates, 2)
+        """
+        return np.take(np.asarray(values), self.plate_channels, axis=axis)
+
+    def __repr__(self):
+        ends = ', '.join(f'{self.channel_labels[a]}-{self.channel_labels[b]}' for a, b in self.plate_channels)
+        return f'DetectorLayout({self.n_plates} plates: {ends})'
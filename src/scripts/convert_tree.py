@@ -0,0 +1,59 @@
+# ===============
+# convert_tree.py
+# ===============
+#
+# Converts every InfiniiVision .bin file under a data directory (for
+# example the DataBox/Gesher_Muons folder) in parallel, using one
+# process per core. Replaces calling IF_bin_to_csv.py once per file.
+#
+# Usage: python convert_tree.py [--force] <data_path> [<path_to_save>] [csv|npz|npz-compressed|npz-int16|npz-int16-compressed] [workers]
+#
+# Without <path_to_save> (or with '-') each file is converted next to its
+# .bin file. Files converted before and unchanged since are skipped, and
+# interrupted conversions resume; --force reconverts everything.
+# The exit code is non-zero only if data_path is not a directory or at
+# least one file failed to convert.
+
+
+import os
+import sys
+import time
+
+# Add src directory to system path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.convert as cv
+
+
+if __name__ == '__main__':
+    force = '--force' in sys.argv
+    args  = [arg for arg in sys.argv[1:] if arg != '--force']
+
+    if len(args) < 1 or len(args) > 4:
+        sys.stderr.write("Usage: python %s [--force] <data_path> [<path_to_save>] [csv|npz|npz-compressed|npz-int16|npz-int16-compressed] [workers]\n" % sys.argv[0])
+        sys.exit(2)
+
+    data_path     = args[0]
+    out_path      = args[1] if len(args) > 1 and args[1] != '-' else None
+    output_format = args[2] if len(args) > 2 else 'csv'
+    workers       = int(args[3]) if len(args) > 3 else None
+
+    start   = time.perf_counter()
+    try:
+        results = cv.convert_tree(data_path, out_path, format=output_format, workers=workers, force=force)
+    except FileNotFoundError as e:
+        sys.stderr.write(f'{e}\n')
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    failed  = [result for result in results if 'error' in result]
+    skipped = [result for result in results if result.get('skipped')]
+    mb      = sum(result['bytes'] for result in results if 'error' not in result and not result['skipped']) / 1e6
+
+    print(f'Converted {len(results) - len(failed) - len(skipped)}/{len(results)} files ({len(skipped)} unchanged), '
+          f'{mb:.1f} MB in {elapsed:.1f} s ({mb / max(elapsed, 1e-9):.1f} MB/s)')
+
+    if failed:
+        for result in failed:
+            sys.stderr.write(f"FAILED {result['bin_path']}: {result['error']}\n")
+        sys.exit(1)
@@ -31,6 +31,7 @@ sys.path.insert(0, src_path)
 try:
     import utils.functions as fn
     from models.event import Event
+    from models.dataset import iter_events
 except Exception as e:
     print("Failed to import module packages. Check whether relative path to /src is correct:")
     print(src_path)
@@ -64,59 +65,57 @@ method options: 'peak', 'fwhm'
 
 def get_dt(scope_config, method = 'fwhm'):
 
-    seg = 1
     dt_arr = []
 
-    while True:
-        try:
-            myevent = Event(run_path, seg, scope_config)
-        
-            # Process event data and store in variables
-            myevent.get_data()
-            mydata = myevent.data
-            times  = myevent.times
-
-            # Zero baselines:
-            for idx, row in enumerate(mydata):
-                bl = fn.find_baseline(row)[0]
-                mydata[idx] = mydata[idx] - bl
-    
-            wf1 = mydata[2]
-            wf2 = mydata[3]
-
-            #
-            a   = np.argmin(np.abs(times[0] - 0))
-            b   = np.argmin(np.abs(times[0] - 100))
-
-            p1_idx,p1_val = fn.get_first_peak(wf1, threshold = 140, ROI=(a,b))
-            p2_idx,p2_val = fn.get_first_peak(wf2, threshold = 140, ROI=(a,b))
-            risetime1     = fn.get_risetime(t, wf1, p1_idx)
-            risetime2     = fn.get_risetime(t, wf2, p2_idx)
-
-            if p1_idx and p2_idx != None:
-                dt = np.round(risetime1 - risetime2, 2)
+    # Events are read ahead in background threads while each one is analysed
+    for myevent in iter_events(run_path, scope_config):
+        # Process event data and store in variables
+        mydata = myevent.data
+        times  = myevent.times
+
+        # Zero baselines:
+        for idx, row in enumerate(mydata):
+            bl = fn.find_baseline(row)[0]
+            mydata[idx] = mydata[idx] - bl
+
+        wf1 = mydata[2]
+        wf2 = mydata[3]
+
+        #
+        t        = times[0]
+        ROI_time = (0, 100)
+        a        = fn.time_index(t, ROI_time[0])
+        b        = fn.time_index(t, ROI_time[1])
+
+        p1_idx,p1_val = fn.get_first_peak(wf1, threshold = 140, ROI=(a,b))
+        p2_idx,p2_val = fn.get_first_peak(wf2, threshold = 140, ROI=(a,b))
+
+        if p1_idx != None and p2_idx != None:
+            try:
+                risetime1 = fn.get_risetime(t, wf1, p1_idx, ROI_time)
+                risetime2 = fn.get_risetime(t, wf2, p2_idx, ROI_time)
+            except ValueError as e:
+                # Rise level outside the sampled edge (noisy or clipped pulse)
+                print(f'Segment {myevent.segment}: no risetime ({e}), skipped')
+                continue
+
+            dt = np.round(risetime1 - risetime2, 2)
+            dt_arr.append(dt)
+        #
+
+        """
+        # Find first relevant peak
+        peak1_idx, egress_idx1 = fn.find_peak(wf1, threshold=thresh, ROI=ROI)
+        peak2_idx, egress_idx2 = fn.find_peak(wf2, threshold=thresh, ROI=ROI)
+
+        if peak1_idx and peak2_idx != None:
+            if method == 'peak':
+                dt = np.round(times[0][peak1_idx] - times[0][peak2_idx], 1)
                 dt_arr.append(dt)
-            else:
-                pass
-            #
-
-            """
-            # Find first relevant peak
-            peak1_idx, egress_idx1 = fn.find_peak(wf1, threshold=thresh, ROI=ROI)
-            peak2_idx, egress_idx2 = fn.find_peak(wf2, threshold=thresh, ROI=ROI)
-
-            if peak1_idx and peak2_idx != None:
-                if method == 'peak':
-                    dt = np.round(times[0][peak1_idx] - times[0][peak2_idx], 1)
-                    dt_arr.append(dt)
-                elif method == 'fwhm':
-                    dt = times[0][egress_idx1] - times[0][egress_idx2]
-                    dt_arr.append(dt)
-            """
-
-            seg += 1
-        except:
-            break
+            elif method == 'fwhm':
+                dt = times[0][egress_idx1] - times[0][egress_idx2]
+                dt_arr.append(dt)
+        """
 
     return dt_arr
 
@@ -82,8 +82,8 @@ t   = times[0]
 wf1 = mydata[0]
 wf2 = mydata[1]
 
-a   = np.argmin(np.abs(t - -50))
-b   = np.argmin(np.abs(t - 75))
+a   = fn.time_index(t, -50)
+b   = fn.time_index(t, 75)
 
 p1_idx,p1_val = fn.get_first_peak(wf1, threshold = 140, ROI=(a,b))
 p2_idx,p2_val = fn.get_first_peak(wf2, threshold = 140, ROI=(a,b))
@@ -19,6 +19,7 @@ sys.path.insert(0, src_path)
 # Import package modules
 try:
     import utils.functions as fn
+    import utils.tracks as tk
     from models.event import Event
 except:
     print("Failed to import module packages. Check whether relative path to /src is correct:")
@@ -91,7 +92,7 @@ ax1.plot(t, wf)
 try:
     peak_idx = dtm[0][0][0]
     rt       = np.round(dtm[0][0][1],2)
-    t_idx    = np.argmin(np.abs(t-rt))
+    t_idx    = fn.time_index(t, rt)
     ax1.scatter(t[peak_idx], wf[peak_idx], marker = '*', color='blue', zorder=2)
     #ax1.scatter(t[t_idx], wf[t_idx], color = 'darkblue', zorder=2, label=rt)
     ax1.axvline(rt, color='blue', label=rt)
@@ -120,7 +121,7 @@ ax2.plot(t, wf)
 try:
     peak_idx = dtm[1][0][0]
     rt       = np.round(dtm[1][0][1],2)
-    t_idx    = np.argmin(np.abs(t-rt))
+    t_idx    = fn.time_index(t, rt)
     ax2.scatter(t[peak_idx], wf[peak_idx], marker = '*', color='blue', zorder=2)
     #ax2.scatter(t[t_idx], wf[t_idx], color = 'darkblue', zorder=2, label=rt)
     ax2.axvline(rt, color='blue', label=rt)
@@ -149,7 +150,7 @@ ax3.plot(t, wf)
 try:
     peak_idx = dtm[2][0][0]
     rt       = np.round(dtm[2][0][1],2)
-    t_idx    = np.argmin(np.abs(t-rt))
+    t_idx    = fn.time_index(t, rt)
     ax3.scatter(t[peak_idx], wf[peak_idx], marker = '*', color='blue', zorder=2)
     #ax3.scatter(t[t_idx], wf[t_idx], color = 'darkblue', zorder=2, label=rt)
     ax3.axvline(rt, color='blue', label=rt)
@@ -178,7 +179,7 @@ ax4.plot(t, wf)
 try:
     peak_idx = dtm[3][0][0]
     rt       = np.round(dtm[3][0][1],2)
-    t_idx    = np.argmin(np.abs(t-rt))
+    t_idx    = fn.time_index(t, rt)
     ax4.scatter(t[peak_idx], wf[peak_idx], marker = '*', color='blue', zorder=2)
     #ax4.scatter(t[t_idx], wf[t_idx], color = 'darkblue', zorder=2, label=rt)
     ax4.axvline(rt, color='blue', label=rt)
@@ -213,20 +214,12 @@ plate_pos = np.array([L*4, L*3, L*2, L*1])
 xerr     = np.full(len(xa), s)
 xerr = None
 
-mask = ~np.isnan(xa)
-print(mask)
-
-x_masked = xa[mask]
-print(xa, plate_pos)
-y_masked = plate_pos[mask]
-
-def linear(x, m, c):
-    return m*x + c
-
-try:
-    popt, pcov = scipy.optimize.curve_fit(linear, y_masked, x_masked, sigma=xerr, p0=[-1, 100])
-except:
-    popt, pcov = scipy.optimize.curve_fit(linear, y_masked, x_masked, sigma=xerr, p0=[1, -100])
+# Closed-form straight-line fit of the hits, NaN (missing) hits left out.
+# With fewer than two plates hit there is no track (NaN slope)
+slope, intercept, pcov, chi2 = tk.fit_tracks(xa, plate_pos, x_err=xerr)
+has_track = np.isfinite(slope[0])
+if has_track == False:
+    print(f'No track: {np.count_nonzero(np.isfinite(xa))} of {len(xa)} plates hit, at least 2 needed')
 
 fig, ax = plt.subplots(figsize = (7,6))
 
@@ -250,8 +243,11 @@ for idx, x in enumerate(xa):
     except:
         pass
 
-height_vals = np.linspace(220, -80)
-ax.plot(linear(height_vals, *popt),height_vals,linestyle='dashed',color ='black',linewidth = 3, zorder=2)
+if has_track == True:
+    height_vals = np.linspace(220, -80)
+    ax.plot(slope[0]*height_vals + intercept[0],height_vals,linestyle='dashed',color ='black',linewidth = 3, zorder=2)
+else:
+    ax.set_title('No track: fewer than two plates hit')
 
 ax.set_xlim(-20,165)
 ax.set_ylim(0,220)
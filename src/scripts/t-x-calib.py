@@ -18,6 +18,8 @@ sys.path.insert(0, src_path)
 try:
     import utils.functions as fn
     from models.event import Event
+    from models.dataset import iter_events
+    from utils.runindex import run_index
 except Exception as e:
     print("Failed to import module packages. Check whether relative path to /src is correct:")
     print(src_path)
@@ -40,69 +42,78 @@ pdf      = PdfPages(pdf_path)
 dir_path = 'Calib/Position'
 run_path = os.path.join(lcd_path, dir_path)
 
+# Source positions along the plate: label, position in cm, first and last
+# run, and the initial guess of the dt fit
+positions = [
+    ('L',  24,  1,  3,  [50, -7, 2]),
+    ('CL', 48,  4,  6,  [50, -3, 2]),
+    ('C',  72,  7,  9,  [50,  0, 2]),
+    ('CR', 96,  10, 12, [50,  3, 2]),
+    ('R',  120, 13, 15, [50,  7, 2]),
+]
+
 def gaussian(x, A, m, s):
     return A * np.exp(-(((x-m)**2)/(s**2)))
 
 
 def get_dt_arr(scope_config, fraction):
-
-    seg    = 1
+    """
+    Returns the dt between channels 3 and 4 of every event in the run with a
+    first peak on both. fraction may be an array of fractions, all timed in
+    the same pass over each event: each dt is then an array, one per fraction.
+    """
     dt_arr = []
 
-    while True:
+    # Events are read ahead in background threads while each one is analysed
+    # A missing peak or edge gives -1 / NaN rather than an exception, so any
+    # exception here is a real error and is raised
+    for myevent in iter_events(run_path, scope_config):
 
-        try:
-            # Instantiate event
-            myevent = Event(run_path, seg, scope_config)
+        # Process event data and store
+        myevent.zero_baselines()
+        data = myevent.data
 
-            # Process event data and store
-            myevent.get_data()
-            myevent.zero_baselines()
-            data = myevent.data
-            
-            t   = myevent.times[0]
-            wf1 = data[2]
-            wf2 = data[3]
+        t     = myevent.times[0]
+        block = np.array([data[2], data[3]])
 
-            # ROI boundaries
-            a = np.argmin(np.abs(t - 0))
-            b = np.argmin(np.abs(t - 100))
-            ROI = (a,b)
+        # ROI boundaries
+        a = fn.time_index(t, 0)
+        b = fn.time_index(t, 100)
+        ROI = (a,b)
 
-            # Get first peaks of waveforms
-            threshold = 140
-            p1, _ = fn.get_first_peak(wf1, threshold=threshold, ROI=ROI)
-            p2, _ = fn.get_first_peak(wf2, threshold=threshold, ROI=ROI)
+        # Get first peaks of waveforms
+        threshold = 140
+        peaks, _  = fn.get_first_peaks(block, threshold=threshold, ROI=ROI)
 
+        if peaks[0] != -1 and peaks[1] != -1:
+            # Get risetimes, one per fraction
+            risetimes = fn.leading_edge_times(block, t, peaks, a, fraction=fraction)
 
-            if p1 and p2 != None:
-                # Get risetimes
-                fraction = fraction
-                risetime1 = fn.get_risetime(t, wf1, p1, ROI, fraction=fraction)
-                risetime2 = fn.get_risetime(t, wf2, p2, ROI, fraction=fraction)
+            dt = risetimes[0] - risetimes[1]
+            dt_arr.append(dt)
 
-                dt = risetime1 - risetime2
-                dt_arr.append(dt)
+    return dt_arr
 
-            seg+=1
 
-        except Exception:
-            break
+def get_runs_dt(s, f, fraction):
+    """
+    Returns the dt of every event of runs s..f, see get_dt_arr. Runs missing
+    from run_path are skipped with a warning; any other error is raised.
+    """
+    A = []
+    for i in range(s, f+1):
+        scope_config = [(f'dt-run{i}', 4)]
+        if len(run_index(run_path).segments(scope_config)) == 0:
+            print(f'Warning: dt-run{i} not found in {run_path}, skipped')
+            continue
+        A += get_dt_arr(scope_config, fraction=fraction)
 
-    return dt_arr
+    return A
 
 
 def get_dist(s, f, bins, p0, fraction=0.25):
 
-    A = []
-    for i in range(s, f+1):
-        try:
-            dt = get_dt_arr([(f'dt-run{i}', 4)], fraction=0.25)
-            A.append(dt)
-        except:
-            A.append([])
-
-    A = A[0] + A[1] + A[2]
+    A = get_runs_dt(s, f, fraction)
 
     hist = np.histogram(A, bins=bins)
     mid_points = hist[1][:-1] + np.diff(hist[1])/2
@@ -112,6 +123,27 @@ def get_dist(s, f, bins, p0, fraction=0.25):
 
     return popt
 
+
+def scan_fractions(s, f, bins, p0, fractions):
+    """
+    Fits the dt distribution of runs s..f for every fraction, timing all
+    fractions in one pass over the data. Returns the fitted widths.
+    """
+    A = np.array(get_runs_dt(s, f, fractions)).reshape(-1, len(fractions))
+
+    widths = np.full(len(fractions), np.nan)
+    for num in range(len(fractions)):
+        hist = np.histogram(A[:, num][np.isfinite(A[:, num])], bins=bins)
+        mid_points = hist[1][:-1] + np.diff(hist[1])/2
+        # A fit that does not converge leaves its width NaN
+        try:
+            popt, pcov = scipy.optimize.curve_fit(gaussian, mid_points, hist[0], p0=p0)
+            widths[num] = abs(popt[2])
+        except RuntimeError:
+            pass
+
+    return widths
+
 fig, ax = plt.subplots(figsize=(6,3))
 bins = np.arange(-22.5, 22.5, 1)
 x_vals = np.linspace(-15,15,200)
@@ -119,32 +151,36 @@ x_vals = np.linspace(-15,15,200)
 m_arr = []
 s_arr = []
 
-popt = get_dist(1, 3, bins, [50, -7, 2])
-ax.plot(x_vals, gaussian(x_vals, *popt), label='L')
-m_arr.append(popt[1]); s_arr.append(popt[2])
-
-
-popt = get_dist(4, 6, bins, [50, -3, 2])
-ax.plot(x_vals, gaussian(x_vals, *popt), label='CL')
-m_arr.append(popt[1]); s_arr.append(popt[2])
-
-
-popt = get_dist(7, 9, bins, [50, 0, 2])
-ax.plot(x_vals, gaussian(x_vals, *popt), label='C')
-m_arr.append(popt[1]); s_arr.append(popt[2])
+for label, _, s, f, p0 in positions:
+    popt = get_dist(s, f, bins, p0)
+    ax.plot(x_vals, gaussian(x_vals, *popt), label=label)
+    m_arr.append(popt[1]); s_arr.append(abs(popt[2]))
 
+ax.legend()
+ax.set_xlabel(r'$\Delta t$ [ns]')
+ax.grid('on', linestyle='--', alpha=0.5)
+fig.tight_layout()
 
-popt = get_dist(10, 12, bins, [50, 3, 2])
-ax.plot(x_vals, gaussian(x_vals, *popt), label = 'CR')
-m_arr.append(popt[1]); s_arr.append(popt[2])
+pdf.savefig()
+plt.close()
 
+# =============
+# Fraction scan
+# =============
 
-popt = get_dist(13, 15, bins, [50, 7, 2])
-ax.plot(x_vals, gaussian(x_vals, *popt), label = 'R')
-m_arr.append(popt[1]); s_arr.append(popt[2])
+# dt resolution of the position closest to the plate centre against the timing fraction
+label, _, s, f, p0 = min(positions, key=lambda position: abs(position[1] - 144/2))
+fractions          = np.round(np.arange(0.05, 0.55, 0.05), 2)
+widths             = scan_fractions(s, f, bins, p0, fractions)
 
-ax.legend()
-ax.set_xlabel(r'$\Delta t$ [ns]')
+fig, ax = plt.subplots(figsize=(6,3))
+ax.plot(fractions, widths, 'o-', color='black')
+if np.isfinite(widths).any():
+    best = fractions[np.nanargmin(widths)]
+    ax.axvline(best, linestyle='--', color='red', label=f'Best fraction: {best}')
+    ax.legend()
+ax.set_xlabel(f'Fraction of peak height ({label}, runs {s}-{f})')
+ax.set_ylabel(r'$\Delta t$ resolution [ns]')
 ax.grid('on', linestyle='--', alpha=0.5)
 fig.tight_layout()
 
@@ -158,16 +194,16 @@ plt.close()
 def linear(x, m, c):
     return m*x + c
 
-pos = [24, 48, 72, 96, 120]
+pos = [position[1] for position in positions]
 popt, pcov = scipy.optimize.curve_fit(linear, pos, m_arr, p0=[1, 70], sigma=s_arr)
 
 fig, ax = plt.subplots(figsize=(6,3))
 x_vals = np.linspace(0,144,100)
 ax.plot(x_vals, linear(x_vals, *popt), color = 'black', label = 'Linear Fit')
 
-labels = ['L', 'CL', 'C', 'CR', 'R']
+labels = [position[0] for position in positions]
 
-for i in range(0,5):
+for i in range(len(positions)):
     ax.errorbar(pos[i], m_arr[i], yerr=s_arr[i],fmt='o', capsize=5, capthick=3, label = labels[i])
 
 ax.set_xlabel('Position [cm]')
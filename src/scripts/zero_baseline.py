@@ -113,8 +113,10 @@ plt.close()
 
 mydata2  = [] # baseline corrected mydata
 unmasked = [] # Only the unmasked part, i.e. the baseline
-for wf in mydata:
-    bl, std, wf_smooth, mask = fn.find_baseline(wf)
+
+# Baselines and masks of all channels, computed once and cached on the event
+baselines, stds, masks = myevent.baselines()
+for wf, bl, mask in zip(mydata, baselines, masks):
     wf2 = wf - bl
     unm = np.ma.array(wf2, mask=mask)
 
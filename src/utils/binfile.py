@@ -0,0 +1,421 @@
+import os
+import struct
+import numpy as np
+
+from utils.timeaxis import TimeAxis
+
+# ---------------------------------------------------------
+# Header layouts of the InfiniiVision binary format, as read
+# field by field in IF_bin_to_csv.py.
+# ---------------------------------------------------------
+FILE_HEADER     = struct.Struct('<2s2sii')
+WAVEFORM_HEADER = struct.Struct('<iiiiifdddii16s16s24s16sdI')
+DATA_HEADER     = struct.Struct('<ihhi')
+
+# Float buffer types and the label suffix the converter gives them
+FLOAT_BUFFER_SUFFIX = {
+    1 : "",
+    2 : "_PkMax",
+    3 : "_PkMin",
+}
+
+# Buffer type of digital unsigned 8-bit character data (logic channels)
+DIGITAL_BUFFER_TYPE = 6
+
+# Dtype of the (segment, channel) offset table
+OFFSET_TABLE_DTYPE = np.dtype([
+    ('segment',         'u4'),
+    ('label',           'U16'),
+    ('buffer_type',     'i2'),
+    ('offset',          'i8'),
+    ('points',          'i8'),
+    ('bytes_per_point', 'i2'),
+    ('x_origin',        'f8'),
+    ('x_increment',     'f8'),
+    ('time_tag',        'f8'),
+    ('x_units',         'i4'),
+    ('y_units',         'i4'),
+])
+
+# =========================================================
+# Buffer decoding
+# =========================================================
+
+def decode_float_buffer(raw, bytes_per_point=4):
+    """
+    Decodes a raw InfiniiVision waveform buffer of 32-bit floats in a
+    single vectorized step.
+
+    Args:
+        raw (bytes)           : the buffer as read from the binary file
+        bytes_per_point (int) : bytes per sample, as given in the waveform
+                                data header (4 for float data)
+    Returns:
+        data (ndarray) : 1D float32 numpy array of the buffer samples
+    """
+    if bytes_per_point != 4:
+        raise ValueError(f"Unsupported bytes per point for float data: {bytes_per_point}")
+
+    return np.frombuffer(raw, dtype='<f4')
+
+
+def decode_digital_buffer(raw):
+    """
+    Decodes a raw 8-bit digital (logic) buffer into its byte codes, one
+    byte per sample holding 8 digital channels.
+
+    Args:
+        raw (bytes) : the buffer as read from the binary file
+    Returns:
+        codes (ndarray) : 1D uint8 numpy array of the buffer samples
+    """
+    return np.frombuffer(raw, dtype=np.uint8)
+
+
+def unpack_digital(codes):
+    """
+    Unpacks digital byte codes into their bits, most significant bit first,
+    which is the column order of the converted digital csv files.
+
+    Args:
+        codes (ndarray) : uint8 array of any shape
+    Returns:
+        bits (ndarray) : uint8 array of 0/1 with a trailing axis of length 8
+    """
+    return np.unpackbits(np.asarray(codes, dtype=np.uint8)[..., None], axis=-1)
+
+
+# Csv text of the 8 bits of every byte code, as written by the converter
+DIGITAL_CSV_BITS = np.array([", ".join(format(code, '08b')) for code in range(256)])
+
+
+def time_axis(x_origin, x_increment, points):
+    """
+    Builds the time axis of a waveform as x_origin + i*x_increment.
+
+    Args:
+        x_origin (float)    : time of the first sample
+        x_increment (float) : time between samples
+        points (int)        : number of samples
+    Returns:
+        t (ndarray) : 1D float64 numpy array of sample times
+    """
+    return x_origin + np.arange(points) * x_increment
+
+
+def write_csv_block(csv, fmt, *columns):
+    """
+    Writes equal-length columns to an open csv file using a single
+    string formatting operation instead of one per row.
+
+    Args:
+        csv (file)  : open text file handle
+        fmt (str)   : row format string, including the trailing newline
+                      example: "%E, %f\n"
+        columns     : 1D arrays (numbers or strings), one per format field
+    Returns:
+        None
+    """
+    n = len(columns[0])
+    if n == 0:
+        return
+
+    # Interleave the columns row by row as plain Python objects
+    items = [None] * (n * len(columns))
+    for num, col in enumerate(columns):
+        items[num::len(columns)] = np.asarray(col).tolist()
+
+    csv.write((fmt * n) % tuple(items))
+
+
+# =========================================================
+# Random access to segmented binary files
+# =========================================================
+
+class SegmentedBinFile:
+    """
+    Memory-mapped reader of a segmented InfiniiVision binary file. The
+    file headers are scanned once to build an offset table of every
+    (segment, channel) buffer, after which any waveform is returned as a
+    zero-copy float32 view into the mapped file (uint8 codes for digital
+    buffers).
+    """
+    def __init__(self, filepath):
+        """
+        Args:
+            filepath (str) : path to the .bin file
+                             example filename: 'scope-1-run8.bin'
+        """
+        self.filepath = filepath
+        self.mm       = np.memmap(filepath, dtype=np.uint8, mode='r')
+
+        self.table    = None
+        self.index    = {}
+
+        self.scan_headers()
+
+    def scan_headers(self):
+        """
+        Walks the file and waveform headers once, recording the position
+        and time axis of every float and digital buffer.
+
+        Args:
+            None
+        Returns:
+            None
+            => Updates self.table and self.index.
+        """
+        mm = self.mm
+        (cookie, version, file_size, waveforms) = FILE_HEADER.unpack_from(mm, 0)
+        self.version = version.decode('utf-8')
+
+        rows = []
+        pos  = FILE_HEADER.size
+        for i in range(waveforms):
+            header         = WAVEFORM_HEADER.unpack_from(mm, pos)
+            header_size    = header[0]
+            buffers        = header[2]
+            x_increment    = header[7]
+            x_origin       = header[8]
+            x_units        = header[9]
+            y_units        = header[10]
+            label          = header[14].decode('utf-8').rstrip(chr(0))
+            time_tag       = header[15]
+            segment_index  = header[16]
+            pos           += max(header_size, WAVEFORM_HEADER.size)
+
+            for j in range(buffers):
+                (data_header_size, buffer_type, bytes_per_point, buffer_size) = DATA_HEADER.unpack_from(mm, pos)
+                pos += max(data_header_size, DATA_HEADER.size)
+
+                if buffer_type in FLOAT_BUFFER_SUFFIX:
+                    rows.append((segment_index, label + FLOAT_BUFFER_SUFFIX[buffer_type],
+                                 buffer_type, pos, buffer_size // bytes_per_point,
+                                 bytes_per_point, x_origin, x_increment, time_tag,
+                                 x_units, y_units))
+                elif buffer_type == DIGITAL_BUFFER_TYPE:
+                    rows.append((segment_index, label, buffer_type, pos, buffer_size,
+                                 1, x_origin, x_increment, time_tag,
+                                 x_units, y_units))
+
+                pos += buffer_size
+
+        self.table = np.array(rows, dtype=OFFSET_TABLE_DTYPE)
+        self.index = {(int(row['segment']), str(row['label'])): num for num, row in enumerate(self.table)}
+
+    @property
+    def segments(self):
+        """Sorted array of the segment indices present in the file."""
+        return np.unique(self.table['segment'])
+
+    def labels(self, digital=False):
+        """
+        Args:
+            digital (bool) : list digital instead of analog channels
+        Returns:
+            labels (list) : channel labels, in order of first appearance
+        """
+        is_digital = self.table['buffer_type'] == DIGITAL_BUFFER_TYPE
+        table      = self.table[is_digital if digital else ~is_digital]
+
+        labels, first = np.unique(table['label'], return_index=True)
+        return [str(label) for label in labels[np.argsort(first)]]
+
+    @property
+    def channels(self):
+        """Analog channel labels present in the file."""
+        return self.labels()
+
+    @property
+    def digital_channels(self):
+        """Digital channel labels present in the file."""
+        return self.labels(digital=True)
+
+    def entry(self, segment, channel):
+        """
+        Returns the offset table row of a (segment, channel) buffer.
+
+        Args:
+            segment (int)     : segment index, as numbered by the scope
+            channel (int/str) : channel label, example: 1 or '1'
+        Returns:
+            row (np.void) : row of self.table
+        """
+        key = (int(segment), str(channel))
+        if key not in self.index:
+            raise KeyError(f"No waveform for segment {key[0]}, channel '{key[1]}' in {self.filepath}")
+
+        return self.table[self.index[key]]
+
+    def get_waveform(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index
+            channel (int/str) : channel label
+        Returns:
+            wf (ndarray) : read-only float32 view of the waveform in volts,
+                           or of the uint8 codes for a digital channel
+        """
+        row    = self.entry(segment, channel)
+        offset = int(row['offset'])
+        nbytes = int(row['points']) * int(row['bytes_per_point'])
+
+        if row['buffer_type'] == DIGITAL_BUFFER_TYPE:
+            return self.mm[offset:offset + nbytes]
+
+        return self.mm[offset:offset + nbytes].view('<f4')
+
+    def get_digital(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index
+            channel (int/str) : digital channel label
+        Returns:
+            bits (ndarray) : (samples x 8) uint8 array of 0/1, most significant
+                             bit first
+        """
+        return unpack_digital(self.get_waveform(segment, channel))
+
+    def get_segment(self, segment, channels=None):
+        """
+        Args:
+            segment (int)   : segment index
+            channels (list) : channel labels to return, all channels if None
+        Returns:
+            wfs (list) : float32 views, one per channel
+        """
+        if channels is None:
+            channels = self.channels
+
+        return [self.get_waveform(segment, ch) for ch in channels]
+
+    def get_time_axis(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index
+            channel (int/str) : channel label
+        Returns:
+            t (TimeAxis) : lazy axis of the sample times in seconds
+        """
+        row = self.entry(segment, channel)
+        return TimeAxis(row['x_origin'], row['x_increment'], int(row['points']))
+
+    def close(self):
+        """
+        Drops the file mapping. Views handed out earlier keep it alive
+        until they are released.
+        """
+        self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_header_table(bin_path, headers_path):
+    """
+    Writes the header table of a binary file, one row per (segment, channel)
+    buffer in file order, as a structured .npy array (see OFFSET_TABLE_DTYPE
+    for the fields: segment, label, time_tag, x_origin, x_increment, points,
+    x_units, y_units, ...). Reading it back is a single np.load.
+
+    Args:
+        bin_path (str)     : path to the .bin scope file
+        headers_path (str) : path (or open binary file) of the .npy file to write
+                             example filename: 'scope-1-run8_headers.npy'
+    Returns:
+        rows (int) : number of rows written
+    """
+    table = SegmentedBinFile(bin_path).table
+    np.save(headers_path, table)
+
+    return len(table)
+
+
+# Process-wide cache of open segmented files, keyed by path, file mtime and size
+_open_files = {}
+
+def open_segmented(filepath):
+    """
+    Returns a SegmentedBinFile for the given path, scanning its headers
+    only the first time it is opened in this process. A file that has been
+    rewritten, extended or truncated since (changed mtime or size) is mapped
+    and scanned again, so stale offsets are never read.
+
+    Args:
+        filepath (str) : path to the .bin file
+    Returns:
+        binfile (SegmentedBinFile)
+    """
+    filepath = os.path.abspath(filepath)
+    stat     = os.stat(filepath)
+    key      = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _open_files.get(filepath)
+    if cached is None or cached[0] != key:
+        cached = (key, SegmentedBinFile(filepath))
+        _open_files[filepath] = cached
+
+    return cached[1]
+
+
+# =========================================================
+# Synthetic files (benchmarks and checks)
+# =========================================================
+
+def write_synthetic_bin(filepath, segments=1000, channels=4, points=1000,
+                        x_increment=2.5e-10, seed=0, digital=False):
+    """
+    Writes a synthetic segmented InfiniiVision binary file with one
+    normal 32-bit float buffer per (channel, segment) waveform, and
+    optionally one digital (logic) buffer per segment.
+
+    Args:
+        filepath (str)      : path of the .bin file to create
+        segments (int)      : number of segments per channel
+        channels (int)      : number of analog channels
+        points (int)        : samples per waveform
+        x_increment (float) : time between samples in seconds
+        seed (int)          : random seed for the noise
+        digital (bool)      : add a 'D0-D7' logic waveform to every segment
+    Returns:
+        None
+    """
+    rng      = np.random.default_rng(seed)
+    x_origin = -x_increment * (points // 2)
+
+    with open(filepath, 'wb') as f:
+        f.write(FILE_HEADER.pack(b'AG', b'10', 0, segments * (channels + int(digital))))
+
+        for ch in range(1, channels + 1):
+            for seg in range(1, segments + 1):
+                label = str(ch).encode('utf-8')
+                f.write(WAVEFORM_HEADER.pack(140, 1, 1, points, 1,
+                                             points * x_increment, x_origin,
+                                             x_increment, x_origin, 2, 1,
+                                             b'01 JAN 2025', b'00:00:00:00',
+                                             b'DSOX1204G:CN00000000', label,
+                                             seg * 1e-2, seg))
+
+                wf = rng.normal(0, 2e-3, points).astype('<f4')
+                f.write(DATA_HEADER.pack(12, 1, 4, wf.nbytes))
+                f.write(wf.tobytes())
+
+        if digital:
+            for seg in range(1, segments + 1):
+                f.write(WAVEFORM_HEADER.pack(140, 6, 1, points, 1,
+                                             points * x_increment, x_origin,
+                                             x_increment, x_origin, 2, 3,
+                                             b'01 JAN 2025', b'00:00:00:00',
+                                             b'DSOX1204G:CN00000000', b'D0-D7',
+                                             seg * 1e-2, seg))
+
+                codes = rng.integers(0, 256, points, dtype=np.uint8)
+                f.write(DATA_HEADER.pack(12, DIGITAL_BUFFER_TYPE, 1, codes.nbytes))
+                f.write(codes.tobytes())
+
+        file_size = f.tell()
+        f.seek(4)
+        f.write(struct.pack('<i', file_size))
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default byte budget of the process-wide waveform cache
+DEFAULT_CACHE_BYTES = 512 * 2**20
+
+
+class WaveformCache:
+    """
+    Least-recently-used cache of loaded waveform arrays with a byte budget.
+    Cached arrays are made read-only, since every caller receives the same
+    object; derive new arrays from them (wf - bl) rather than editing in place.
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Args:
+            max_bytes (int) : total size of the cached arrays before the least
+                              recently used ones are evicted. 0 disables caching.
+        """
+        self.max_bytes = int(max_bytes)
+        self.nbytes    = 0
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple) : hashable key of the waveform
+        Returns:
+            value (ndarray) : the cached array, or None on a miss
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Caches value under key, evicting least recently used arrays until the
+        cache fits its budget. Arrays larger than the whole budget are not cached.
+
+        Args:
+            key (tuple)     : hashable key of the waveform
+            value (ndarray) : array to cache
+        Returns:
+            value (ndarray) : the same array, now read-only
+        """
+        value.setflags(write=False)
+        if value.nbytes > self.max_bytes:
+            return value
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            self._evict()
+
+        return value
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._entries:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes    -= old.nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """
+        Args:
+            max_bytes (int) : new byte budget, evicting entries if needed
+        """
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        """
+        Drops every cached array and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes    = 0
+            self.hits      = 0
+            self.misses    = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict) : entries, bytes, max_bytes, hits, misses, evictions
+                           and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries'   : len(self._entries),
+                    'bytes'     : self.nbytes,
+                    'max_bytes' : self.max_bytes,
+                    'hits'      : self.hits,
+                    'misses'    : self.misses,
+                    'evictions' : self.evictions,
+                    'hit_rate'  : self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+# Process-wide cache consulted by fn.get_waveform
+waveform_cache = WaveformCache()
@@ -0,0 +1,88 @@
+import os
+import json
+import numpy as np
+
+
+class PositionCalibration:
+    """
+    Linear dt -> x calibration of the scintillator plates, dt = m*x + c, as
+    fitted by t-x-calib.py and saved to t-x-conv.json. The fit is inverted
+    analytically, x = (dt - c)/m, for whole dt arrays at once (the dt_arr of
+    one Event or the dt column of an EventBatch), and the fit covariance is
+    propagated to the positions.
+    """
+    def __init__(self, popt, pcov=None):
+        """
+        Args:
+            popt (ndarray) : (m, c) slope in ns/cm and intercept in ns
+            pcov (ndarray) : 2x2 covariance of (m, c), no fit uncertainty if None
+        """
+        self.m, self.c = (float(p) for p in popt)
+        self.pcov      = np.zeros((2, 2)) if pcov is None else np.asarray(pcov, dtype=float)
+
+    @classmethod
+    def from_json(cls, filepath):
+        """
+        Args:
+            filepath (str) : path to the .json linear fit file, example: 't-x-conv.json'
+        Returns:
+            calib (PositionCalibration)
+        """
+        with open(filepath, 'r') as f:
+            content = json.load(f)
+
+        return cls(content['popt'], content.get('pcov'))
+
+    def positions(self, dt, x_min=0, x_max=144, max_err=25, dt_err=None):
+        """
+        Args:
+            dt (float/ndarray)     : time differences in ns, NaN where not measured
+            x_min (float)          : plate start in cm
+            x_max (float)          : plate end in cm
+            max_err (float)        : positions up to max_err outside [x_min, x_max]
+                                     are clipped to the plate edge, further ones are NaN
+            dt_err (float/ndarray) : uncertainty of dt in ns, added to the fit
+                                     uncertainty if given
+        Returns:
+            x (ndarray)     : positions along the plate in cm, the shape of dt
+            x_err (ndarray) : uncertainty of each position in cm, NaN where x is
+        """
+        dt = np.asarray(dt, dtype=float)
+
+        with np.errstate(invalid='ignore'):
+            x    = (dt - self.c) / self.m
+            keep = (x > x_min - max_err) & (x < x_max + max_err)
+
+        # Gradient of x = (dt - c)/m with respect to (m, c): (-x/m, -1/m)
+        var = (self.pcov[0, 0] * x**2 + 2 * self.pcov[0, 1] * x + self.pcov[1, 1]) / self.m**2
+        if dt_err is not None:
+            var = var + (np.asarray(dt_err, dtype=float) / self.m)**2
+
+        x_err = np.where(keep, np.sqrt(var), np.nan)
+        x     = np.where(keep, np.clip(x, x_min, x_max), np.nan)
+
+        return x, x_err
+
+
+# Process-wide cache of calibrations, keyed by path and file mtime
+_calibrations = {}
+
+def load_calibration(filepath):
+    """
+    Returns the PositionCalibration of a .json linear fit file, reading the
+    file again only when it has changed since it was last loaded.
+
+    Args:
+        filepath (str) : path to the .json linear fit file
+    Returns:
+        calib (PositionCalibration)
+    """
+    filepath = os.path.abspath(filepath)
+    mtime    = os.stat(filepath).st_mtime_ns
+
+    cached = _calibrations.get(filepath)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, PositionCalibration.from_json(filepath))
+        _calibrations[filepath] = cached
+
+    return cached[1]
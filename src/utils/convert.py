@@ -0,0 +1,564 @@
+import os
+import sys
+import re
+import json
+import time
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import utils.binfile as bf
+import utils.store as st
+
+# ---------------------------------------------------------
+# Variables.
+# ---------------------------------------------------------
+waveform_type_dict = {
+    0 : "Unknown",
+    1 : "Normal",
+    2 : "Peak Detect",
+    3 : "Average",
+    4 : "Horizontal Histogram",
+    5 : "Vertical Histogram",
+    6 : "Logic",
+}
+buffer_type_dict = {
+    0 : "Unknown data",
+    1 : "Normal 32-bit float data",
+    2 : "Maximum float data",
+    3 : "Minimum float data",
+    4 : "Time float data",
+    5 : "Counts 32-bit float data",
+    6 : "Digital unsigned 8-bit character data",
+}
+units_dict = {
+    0 : "Unknown",
+    1 : "Volts",
+    2 : "Seconds",
+    3 : "Constant",
+    4 : "Amps",
+    5 : "dB",
+    6 : "Hz",
+}
+
+# Supported output formats of convert_file
+FORMATS = ("csv", "npz", "npz-compressed", "npz-int16", "npz-int16-compressed")
+
+# Version of the converted output. Bump it whenever the output of a format
+# changes, so that incremental conversions redo files converted before.
+OUTPUT_VERSION = 3
+
+
+# =========================================================
+# Conversion of a single binary file to csv
+# =========================================================
+
+class CsvConversion:
+    """
+    State of one binary file to csv conversion: the open binary input, the
+    <scope>_info.txt message file and the output directory. Replaces the
+    module-level globals of the original IF_bin_to_csv.py script, so several
+    conversions can run in one process.
+    """
+    def __init__(self, bin_path, out_dir, verbose=False, resume=False):
+        """
+        Args:
+            bin_path (str) : path to the .bin scope file
+            out_dir (str)  : directory to save the csv and info files in
+            verbose (bool) : also print the header information
+            resume (bool)  : keep csv files left by an interrupted conversion
+                             of the same source instead of writing them again
+        """
+        self.bin_path = bin_path
+        self.out_dir  = out_dir
+        self.verbose  = verbose
+        self.resume   = resume
+        self.outputs  = 0
+
+        self.bin_input = None
+        self.msg       = None
+
+    # =========================================================
+    # Function to build an output path in the output directory
+    # =========================================================
+    def output_path(self, replacement):
+        file = re.sub(r"\.bin", replacement, os.path.basename(self.bin_path))
+        return os.path.join(self.out_dir, file)
+
+    def csv_output_path(self, label, segment_index):
+        if segment_index == 0:
+            return self.output_path("_%s.csv" % label)
+        else:
+            return self.output_path("_segment-%d_%s.csv" % (segment_index, label))
+
+    def open_csv(self, csv_output_file, buffer_size):
+        """
+        Opens a temporary file for a csv output, or returns None and skips the
+        buffer if the csv file is already there from an interrupted run. Csv
+        files only appear under their final name once fully written (see
+        close_csv), so an existing file is always complete.
+        """
+        if self.resume and os.path.exists(csv_output_file):
+            self.bin_input.seek(buffer_size, 1)
+            return None
+
+        return open(csv_output_file + ".part", "w")
+
+    def close_csv(self, csv, csv_output_file):
+        if csv is not None:
+            csv.close()
+            os.replace(csv_output_file + ".part", csv_output_file)
+
+        self.outputs += 1
+        self.prtsv("CSV waveform data saved to: %s" % csv_output_file)
+
+    # =========================================================
+    # Function to print and save output information.
+    # =========================================================
+    def prtsv(self, string):
+        self.msg.write("%s\n" % string)
+        if self.verbose == True:
+            print(string)
+
+    # =========================================================
+    # Function to read 8-bit digital data from the binary data
+    # file.
+    # =========================================================
+    def read_8bit_digital_data(self, buffer_size, x_origin, x_increment, label, segment_index):
+        csv_output_file = self.csv_output_path(label, segment_index)
+        csv = self.open_csv(csv_output_file, buffer_size)
+        if csv is None:
+            self.close_csv(csv, csv_output_file)
+            return
+
+        # Read the whole buffer at once and look up the bits of all samples
+        # in a single step.
+        codes = bf.decode_digital_buffer(self.bin_input.read(buffer_size))
+        t     = bf.time_axis(x_origin, x_increment, len(codes))
+
+        bf.write_csv_block(csv, "%s, %s\n", t, bf.DIGITAL_CSV_BITS[codes])
+
+        self.close_csv(csv, csv_output_file)
+
+    # =========================================================
+    # Function to read 32-bit float data from the binary data
+    # file.
+    # =========================================================
+    def read_32bit_float_data(self, buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index):
+        csv_output_file = self.csv_output_path(label, segment_index)
+        csv = self.open_csv(csv_output_file, buffer_size)
+        if csv is None:
+            self.close_csv(csv, csv_output_file)
+            return
+
+        # Read the whole buffer at once and decode it in a single step.
+        voltage = bf.decode_float_buffer(self.bin_input.read(buffer_size), bytes_per_point)
+        t       = bf.time_axis(x_origin, x_increment, len(voltage))
+
+        bf.write_csv_block(csv, "%E, %f\n", t, voltage)
+
+        self.close_csv(csv, csv_output_file)
+
+    # =========================================================
+    # Function to print data from individual waveforms in binary
+    # data file.
+    # =========================================================
+    def read_waveform_data(self, x_origin, x_increment, label, segment_index):
+        bin_input = self.bin_input
+        prtsv     = self.prtsv
+
+        prtsv("---------- Waveform Data Header ----------")
+
+        (waveform_data_header_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Waveform Data Header Size = '%d'" % waveform_data_header_size)
+
+        (buffer_type,) = struct.unpack('h', bin_input.read(2))
+        if buffer_type in buffer_type_dict:
+            prtsv("Buffer Type = '%s'" % buffer_type_dict[buffer_type])
+        else:
+            prtsv("Buffer Type (unknown) = '%d'" % buffer_type)
+            raise ValueError("Unknown buffer type %d in %s" % (buffer_type, self.bin_path))
+
+        (bytes_per_point,) = struct.unpack('h', bin_input.read(2))
+        prtsv("Bytes Per Point = '%s'" % bytes_per_point)
+
+        (buffer_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Buffer Size = '%d'" % buffer_size)
+
+        if buffer_type == 1:   # Normal 32-bit float data.
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index)
+        elif buffer_type == 2:   # Maximum float data.
+            label = label + "_PkMax"
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index)
+        elif buffer_type == 3:   # Minimum float data.
+            label = label + "_PkMin"
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index)
+        elif buffer_type == 6:   # Digital unsigned 8-bit char data.
+            self.read_8bit_digital_data(buffer_size, x_origin, x_increment, label, segment_index)
+        else:
+            buffer_bytes = bin_input.read(buffer_size)
+
+    # =========================================================
+    # Function to print data from individual waveforms in binary
+    # data file.
+    # =========================================================
+    def read_waveform(self):
+        bin_input = self.bin_input
+        prtsv     = self.prtsv
+
+        prtsv("---------- Waveform Header ----------")
+
+        (waveform_header_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Waveform Header Size = '%d'" % waveform_header_size)
+
+        (waveform_type,) = struct.unpack('i', bin_input.read(4))
+        if waveform_type in waveform_type_dict:
+            prtsv("Waveform Type = '%s'" % waveform_type_dict[waveform_type])
+        else:
+            prtsv("Waveform Type (unknown) = '%d'" % waveform_type)
+            raise ValueError("Unknown waveform type %d in %s" % (waveform_type, self.bin_path))
+
+        (waveform_buffers,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Number of Waveform buffers = '%d'" % waveform_buffers)
+
+        (points,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Points = '%d'" % points)
+
+        (count,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Count = '%d'" % count)
+
+        (x_display_range,) = struct.unpack('f', bin_input.read(4))
+        prtsv("X Display Range = '%E'" % x_display_range)
+
+        (x_display_origin,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Display Origin = '%E'" % x_display_origin)
+
+        (x_increment,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Increment = '%E'" % x_increment)
+
+        (x_origin,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Origin = '%E'" % x_origin)
+
+        (x_units,) = struct.unpack('i', bin_input.read(4))
+        if x_units in units_dict:
+            prtsv("X Units = '%s'" % units_dict[x_units])
+        else:
+            prtsv("X Units = '%d'" % x_units)
+
+        (y_units,) = struct.unpack('i', bin_input.read(4))
+        if x_units in units_dict:
+            prtsv("Y Units = '%s'" % units_dict[y_units])
+        else:
+            prtsv("Y Units = '%d'" % y_units)
+
+        (date,) = struct.unpack('16s', bin_input.read(16))
+        prtsv("Date = '%s'" % date.decode("utf-8"))
+
+        (time,) = struct.unpack('16s', bin_input.read(16))
+        prtsv("Time = '%s'" % time.decode("utf-8"))
+
+        (frame,) = struct.unpack('24s', bin_input.read(24))
+        prtsv("Frame = '%s'" % frame.decode("utf-8"))
+
+        (waveform_label,) = struct.unpack('16s', bin_input.read(16))
+        label = waveform_label.decode("utf-8").rstrip(chr(0))
+        prtsv("Waveform Label = '%s'" % label)
+
+        (time_tags,) = struct.unpack('d', bin_input.read(8))
+        prtsv("Time Tags = '%E'" % time_tags)
+
+        (segment_index,) = struct.unpack('I', bin_input.read(4))
+        prtsv("Segment Index = '%d'" % segment_index)
+
+        for i in range(waveform_buffers):
+            self.read_waveform_data(x_origin, x_increment, label, segment_index)
+
+    # =========================================================
+    # Main conversion
+    # =========================================================
+    def run(self):
+        """
+        Converts the whole binary file, writing <scope>_info.txt and one csv
+        file per waveform buffer.
+
+        Args:
+            None
+        Returns:
+            outputs (int) : number of csv files written
+        """
+        self.msg       = open(self.output_path("_info.txt"), "w")
+        self.bin_input = open(self.bin_path, "rb")
+
+        try:
+            prtsv     = self.prtsv
+            bin_input = self.bin_input
+
+            prtsv("---------- File Header ----------")
+
+            (cookie,) = struct.unpack('2s', bin_input.read(2))
+            prtsv("Cookie = '%s'" % cookie.decode("utf-8"))
+
+            (file_version,) = struct.unpack('2s', bin_input.read(2))
+            prtsv("File version = '%s'" % file_version.decode("utf-8"))
+
+            (file_size,) = struct.unpack('i', bin_input.read(4))
+            prtsv("File size = '%d'" % file_size)
+
+            (waveforms,) = struct.unpack('i', bin_input.read(4))
+            prtsv("Number of Waveforms = '%d'" % waveforms)
+
+            for i in range(waveforms):
+                self.read_waveform()
+
+        finally:
+            self.bin_input.close()
+            self.msg.close()
+
+        return self.outputs
+
+
+# =========================================================
+# Conversion manifests
+# =========================================================
+
+def file_hash(filepath, chunk_size=1 << 22):
+    """
+    Args:
+        filepath (str) : path to the file
+    Returns:
+        digest (str) : sha256 hex digest of the file content
+    """
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def read_manifest(manifest_path):
+    """
+    Args:
+        manifest_path (str) : path to a <scope>_manifest.json file
+    Returns:
+        manifest (dict) : the manifest, or an empty dict if there is no
+                          readable manifest
+    """
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest_path, manifest):
+    """
+    Writes the manifest atomically, so it is never left half written.
+    """
+    with open(manifest_path + ".part", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + ".part", manifest_path)
+
+
+# =========================================================
+# Public conversion API
+# =========================================================
+
+def convert_file(bin_path, out_dir, format="csv", verbose=False, force=False):
+    """
+    Converts one InfiniiVision binary file.
+
+    Conversions are incremental: a <scope>_manifest.json file next to the output
+    records the size, mtime and sha256 of the source, the output format and
+    OUTPUT_VERSION, and whether the conversion completed. Unchanged sources are
+    skipped (without hashing if size and mtime match), and an interrupted csv
+    conversion of the same source resumes at the first missing segment file.
+
+    Args:
+        bin_path (str) : path to the .bin scope file
+        out_dir (str)  : directory to save the converted files in
+        format (str)   : 'csv' for <scope>_info.txt plus one csv file per segment
+                         and channel, 'npz' or 'npz-compressed' for a single
+                         <scope>.npz run store, 'npz-int16' or
+                         'npz-int16-compressed' for a quantized run store.
+                         All formats also write the header
+                         table <scope>_headers.npy (see binfile.write_header_table).
+        verbose (bool) : print the header information while converting
+        force (bool)   : convert even if the manifest says the output is up to date
+    Returns:
+        result (dict) : bin_path, format, bytes read, seconds taken, number
+                        of output files written, whether the file was
+                        skipped as unchanged and the run store path
+                        (None for csv)
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown output format '%s', expected one of %s" % (format, FORMATS))
+
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    stat          = os.stat(bin_path)
+    basename      = os.path.basename(bin_path)
+    manifest_path = os.path.join(out_dir, re.sub(r"\.bin", "_manifest.json", basename))
+    store_path    = None if format == "csv" else os.path.join(out_dir, re.sub(r"\.bin", ".npz", basename))
+    previous      = {} if force else read_manifest(manifest_path)
+
+    same_output = previous.get("format") == format and previous.get("version") == OUTPUT_VERSION
+    same_stat   = previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns
+
+    result = {
+        "bin_path" : bin_path,
+        "format"   : format,
+        "bytes"    : stat.st_size,
+        "skipped"  : True,
+        "outputs"  : previous.get("outputs", 0),
+        "store"    : store_path,
+    }
+
+    # Fast path: nothing changed since the last complete conversion
+    if same_output and same_stat and previous.get("complete"):
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    # Content check, for sources that were touched or copied but not changed
+    sha256      = file_hash(bin_path)
+    same_source = same_output and previous.get("sha256") == sha256
+
+    manifest = {
+        "source"   : basename,
+        "size"     : stat.st_size,
+        "mtime_ns" : stat.st_mtime_ns,
+        "sha256"   : sha256,
+        "format"   : format,
+        "version"  : OUTPUT_VERSION,
+        "complete" : False,
+    }
+
+    if same_source and previous.get("complete"):
+        manifest["complete"] = True
+        manifest["outputs"]  = previous.get("outputs", 0)
+        write_manifest(manifest_path, manifest)
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    write_manifest(manifest_path, manifest)
+
+    # Structured header table, for vectorized access to time tags and time axes
+    headers_path = os.path.join(out_dir, re.sub(r"\.bin", "_headers.npy", basename))
+    with open(headers_path + ".part", "wb") as f:
+        bf.write_header_table(bin_path, f)
+    os.replace(headers_path + ".part", headers_path)
+
+    if format == "csv":
+        outputs = CsvConversion(bin_path, out_dir, verbose=verbose, resume=same_source).run()
+    else:
+        with open(store_path + ".part", "wb") as f:
+            st.write_run_store(bin_path, f, compress=format.endswith("-compressed"),
+                               quantize_int16=("int16" in format))
+        os.replace(store_path + ".part", store_path)
+        outputs = 1
+
+    manifest["complete"] = True
+    manifest["outputs"]  = outputs
+    write_manifest(manifest_path, manifest)
+
+    result["skipped"] = False
+    result["outputs"] = outputs
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def find_bin_files(root):
+    """
+    Args:
+        root (str) : directory to search recursively
+    Returns:
+        paths (list) : sorted paths of all .bin files under root
+    Raises:
+        FileNotFoundError : if root is not a directory (os.walk would
+                            silently yield nothing)
+    """
+    if not os.path.isdir(root):
+        raise FileNotFoundError("Data directory not found: %s" % root)
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".bin"):
+                paths.append(os.path.join(dirpath, filename))
+
+    return sorted(paths)
+
+
+def _convert_job(bin_path, out_dir, format, force):
+    """
+    Process pool job: converts one file and reports failures as a result
+    instead of raising, so one bad file does not stop the tree.
+    """
+    try:
+        return convert_file(bin_path, out_dir, format=format, force=force)
+    except Exception as e:
+        return {"bin_path": bin_path, "format": format, "error": "%s: %s" % (type(e).__name__, e)}
+
+
+def _add_src_path(src_path):
+    if src_path not in sys.path:
+        sys.path.insert(0, src_path)
+
+
+def convert_tree(root, out_root=None, format="csv", workers=None, report=print, force=False):
+    """
+    Converts every .bin file under root in parallel, one file per process.
+    Files whose manifest shows an up-to-date conversion are skipped (see
+    convert_file), so re-running after adding a run only converts the new run.
+
+    Args:
+        root (str)          : data directory to search, example: the DataBox folder
+        out_root (str)      : directory to mirror the converted tree into. If None,
+                              each file is converted next to its .bin file.
+        format (str)        : output format, see convert_file
+        workers (int)       : number of processes, defaults to the number of cores
+        report (function)   : called with one progress line per finished file,
+                              None to stay silent
+        force (bool)        : reconvert every file regardless of the manifests
+    Returns:
+        results (list) : one result dict per file (see convert_file). Failed
+                         files carry an 'error' entry instead of timings.
+    Raises:
+        FileNotFoundError : if root is not a directory
+    """
+    bin_paths = find_bin_files(root)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(bin_paths)))
+
+    jobs = []
+    for bin_path in bin_paths:
+        if out_root is None:
+            out_dir = os.path.dirname(bin_path)
+        else:
+            out_dir = os.path.join(out_root, os.path.relpath(os.path.dirname(bin_path), root))
+        jobs.append((bin_path, out_dir))
+
+    src_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_add_src_path, initargs=(src_path,)) as pool:
+        futures = [pool.submit(_convert_job, bin_path, out_dir, format, force) for bin_path, out_dir in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            if report is None:
+                continue
+            if "error" in result:
+                report("FAILED %s (%s)" % (result["bin_path"], result["error"]))
+            elif result["skipped"]:
+                report("%s: unchanged, skipped" % result["bin_path"])
+            else:
+                mb = result["bytes"] / 1e6
+                report("%s: %.1f MB in %.2f s (%.1f MB/s)" % (result["bin_path"], mb, result["seconds"],
+                                                             mb / max(result["seconds"], 1e-9)))
+
+    results.sort(key=lambda result: result["bin_path"])
+    return results
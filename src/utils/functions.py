@@ -1,3 +1,5 @@
+import os
+import re
 import numpy as np
 import csv
 import matplotlib.pyplot as plt
@@ -5,13 +7,19 @@ from matplotlib.backends.backend_pdf import PdfPages
 import scipy
 from scipy import interpolate
 
+from utils.timeaxis import TimeAxis
+from utils.cache import waveform_cache
+
 def get_timestamps(filepath, segments = 1000):
     """
-    Reads the <filename>_info.txt files generated by IF_bin_to_csv.py script
-    and extracts an array of timestamps.
+    Extracts an array of timestamps of a run. The structured header table
+    <filename>_headers.npy written next to the info file by the converter is
+    read in a single load; the <filename>_info.txt text files generated by
+    IF_bin_to_csv.py are only parsed if there is no header table.
 
     Args:
-        filepath (str) : path to <filename>_info.txt file
+        filepath (str) : path to <filename>_info.txt file, <filename>_headers.npy
+                         file or <filename>.npz run store
                          example filename: 'scope-1-run7_info.txt'
         segments (int) : the total number of segments in a run (1000 is max for 
                          our scope)
@@ -19,29 +27,19 @@ def get_timestamps(filepath, segments = 1000):
         timestamps (ndarray) : numpy array of floats in seconds
     """
     try:
-        with open(filepath, 'r') as f:
-            lines = f.readlines()
-
-        # Initialise empty timestamps numpy array, expect floats
-        timestamps = np.empty(segments, dtype=float)
-        count      = 0
-
-        # Loop through all the lines in the file to find 'Time Tags'
-        for line in lines:
-            if count >= segments:
-                break
-            if 'Time Tags' in line:
-                timestamp = line.split(" = ")[-1]
-                timestamp = float(timestamp.split('\'')[1])
-                timestamps[count] = timestamp
-                count += 1
-
-        # Cut the timestamps array if there are less events than
-        # expected segments
-        if count < segments:
-            timestamps = timestamps[:count]
-
-        return timestamps
+        if filepath.endswith('.npz'):
+            with np.load(filepath) as npz:
+                return npz['time_tags'][:segments]
+
+        headers_path = re.sub(r'(_info\.txt)$', '_headers.npy', filepath)
+        if os.path.exists(headers_path):
+            table = np.load(headers_path)
+
+            # One time tag per segment: the rows of the first channel
+            first = table['label'] == table['label'][0]
+            return table['time_tag'][first][:segments]
+
+        return get_timestamps_text(filepath, segments)
 
     except Exception as e:
         print("Error in 'get_timestamps'")
@@ -49,41 +47,131 @@ def get_timestamps(filepath, segments = 1000):
         return None
 
 
-def get_waveform(csvfile, xignore=True, negative=True, xconv=1, yconv=1):
+def get_timestamps_text(filepath, segments = 1000):
+    """
+    Reads the <filename>_info.txt files generated by IF_bin_to_csv.py script
+    and extracts an array of timestamps. Fallback of get_timestamps for runs
+    converted without a header table.
+
+    Args:
+        filepath (str) : path to <filename>_info.txt file
+        segments (int) : the total number of segments in a run
+    Returns:
+        timestamps (ndarray) : numpy array of floats in seconds
+    """
+    with open(filepath, 'r') as f:
+        lines = f.readlines()
+
+    # Initialise empty timestamps numpy array, expect floats
+    timestamps = np.empty(segments, dtype=float)
+    count      = 0
+
+    # Loop through all the lines in the file to find 'Time Tags'
+    for line in lines:
+        if count >= segments:
+            break
+        if 'Time Tags' in line:
+            timestamp = line.split(" = ")[-1]
+            timestamp = float(timestamp.split('\'')[1])
+            timestamps[count] = timestamp
+            count += 1
+
+    # Cut the timestamps array if there are less events than
+    # expected segments
+    if count < segments:
+        timestamps = timestamps[:count]
+
+    return timestamps
+
+
+def get_waveform(csvfile, xignore=True, negative=True, xconv=1, yconv=1, dtype=float, fast=True, cache=True):
     """
     Extracts the x,y data from the csv waveform file.
 
     Args:
         csvfile (str)   : path to csv file containing waveform
                           example filename: scope-1-run3_segment-1_1.csv
-        xignore (bool)  :
-        negative (bool) :
-        xconv (float)   :
-        yconv (float)   :
+        xignore (bool)  : only read and return the y (voltage) column
+        negative (bool) : flip the sign of y, for negative pulses
+        xconv (float)   : conversion factor of x, example: 1e9 for s to ns
+        yconv (float)   : conversion factor of y, example: 1e3 for V to mV
+        dtype (type)    : dtype of the returned data, example: np.float32
+        fast (bool)     : parse with numpy's C-level np.loadtxt, reading only the
+                          needed columns. False uses the original csv.reader path.
+        cache (bool)    : serve repeated loads from the process-wide waveform cache
+                          (utils.cache.waveform_cache), keyed by the file, its
+                          modification time and the conversion arguments. Cached
+                          arrays are read-only.
 
     Returns:
         data (ndarray) : two dimensional numpy array containt x and y
-                         subarrays
+                         subarrays, or only y if xignore. None if the file
+                         does not exist (for example past the last segment).
+    Raises:
+        ValueError : if the file exists but cannot be parsed
     """
     try:
-        with open(csvfile, 'r') as f:
-            reader = csv.reader(f)
-            data   = np.array(list(reader), dtype=float)
-            data   = data.T
+        stat = os.stat(csvfile)
+    except FileNotFoundError:
+        return None
+
+    if cache == True:
+        key  = (os.path.abspath(csvfile), stat.st_mtime_ns, stat.st_size,
+                xignore, negative, xconv, yconv, np.dtype(dtype).str, fast)
+        data = waveform_cache.get(key)
+        if data is None:
+            data = waveform_cache.put(key, read_waveform(csvfile, xignore, negative, xconv, yconv, dtype, fast))
+        return data
 
-            data[0] = data[0] * xconv
-            data[1] = data[1] * yconv
+    return read_waveform(csvfile, xignore, negative, xconv, yconv, dtype, fast)
 
-            if negative == True:
-                data[1] = data[1]*(-1)
 
-            if xignore == True:
-                data = data[1]
+def read_waveform(csvfile, xignore, negative, xconv, yconv, dtype, fast):
+    """
+    Parses a csv waveform file, without the cache. See get_waveform for the arguments.
+    """
+    try:
+        if fast == True:
+            usecols = 1 if xignore == True else (0, 1)
+            data    = np.loadtxt(csvfile, delimiter=',', usecols=usecols, dtype=float, ndmin=1)
+            if xignore == False:
+                data = data.reshape(-1, 2).T
+        else:
+            with open(csvfile, 'r') as f:
+                reader = csv.reader(f)
+                data   = np.array(list(reader), dtype=float).T
+                if xignore == True:
+                    data = data[1]
 
-        return data
+    except ValueError as e:
+        raise ValueError(f"Failed to parse waveform csv file {csvfile}: {e}") from e
 
-    except Exception:
-        return None
+    sign = -1 if negative == True else 1
+
+    if xignore == True:
+        return (data * (sign * yconv)).astype(dtype, copy=False)
+
+    data[0] = data[0] * xconv
+    data[1] = data[1] * (sign * yconv)
+
+    return data.astype(dtype, copy=False)
+
+
+def time_index(t, value):
+    """
+    Index of the sample of t closest to value. O(1) for a TimeAxis, an argmin
+    search for a plain array.
+
+    Args:
+        t (TimeAxis/ndarray) : time axis
+        value (float)        : time to look up
+    Returns:
+        idx (int) : index of the nearest sample
+    """
+    if isinstance(t, TimeAxis):
+        return t.index(value)
+
+    return np.argmin(np.abs(np.asarray(t) - value))
 
 
 def find_baseline(wf, width=6, distance=12, prominence=12, roundto = 2, sigma=0.75):
@@ -146,24 +234,229 @@ def find_baseline(wf, width=6, distance=12, prominence=12, roundto = 2, sigma=0.
     return baseline_mean, baseline_std, wf_smooth, mask
 
 
-def get_first_peak(wf, threshold, ROI, min_val=50, smooth=True, sigma=2):
+def find_baselines(block, width=6, distance=12, prominence=12, roundto=2, sigma=0.75, subtract=True,
+                   smoothed=None, return_mask=False):
     """
-    <description>
+    Batched find_baseline over a block of waveforms, for example all channels
+    of an event or a whole (segments x channels x samples) run. The block is
+    smoothed in one pass along its last axis, the peak regions of all
+    waveforms are masked together by painting their intervals into a single
+    mask, and the masked means and deviations are reduced along the last
+    axis. Matches find_baseline waveform by waveform.
 
     Args:
-        
+        block (ndarray)    : waveforms along the last axis, any leading shape
+        width (float)      : see find_baseline
+        distance (float)   : see find_baseline
+        prominence (float) : see find_baseline
+        roundto (int)      : decimals the baselines are rounded to
+        sigma (float)      : smoothing width in samples
+        subtract (bool)    : subtract each (rounded) baseline mean from its
+                             waveform in place. block must then be a writable
+                             float array.
+        smoothed (ndarray) : the block already smoothed with sigma, to reuse
+                             (see Event.smoothed), smoothed here if None
+        return_mask (bool) : also return the baseline masks
     Returns:
-        
+        baseline_mean (ndarray) : baseline of each waveform, shape block.shape[:-1]
+        baseline_std (ndarray)  : standard deviation of each baseline
+        mask (ndarray)          : bool, True outside the baseline, shape
+                                  block.shape. Only if return_mask.
     """
-    if smooth == True:
-        # Smooth waveform
-        wf_sm = scipy.ndimage.gaussian_filter1d(wf, sigma=sigma)
+    block = np.asarray(block)
+    n     = block.shape[-1]
+    rows  = block.reshape(-1, n)
+
+    # Smooth all waveforms at once
+    if smoothed is not None:
+        smooth = np.asarray(smoothed, dtype=float).reshape(-1, n)
+    else:
+        smooth = scipy.ndimage.gaussian_filter1d(rows.astype(float, copy=False), sigma=sigma, axis=-1)
+
+    # Fixed mask shared by every waveform, as in find_baseline
+    fixed = np.zeros(n)
+    fixed[int(n/2)-25:] = 1
+    fixed[n - 40:n]     = 1
+    fixed[0:40]         = 1
+
+    # Peak intervals of all waveforms. A waveform whose range is below the
+    # prominence cannot hold a peak, so find_peaks only runs where needed.
+    starts = []
+    ends   = []
+    owner  = []
+    ptp    = smooth.max(axis=-1) - smooth.min(axis=-1)
+    for r in np.flatnonzero(~(ptp < prominence)):
+        idxs, dicts = scipy.signal.find_peaks(smooth[r], width=width, distance=distance, prominence=prominence)
+        w = (1.5 * dicts['widths']).astype(int)
+        starts.append(np.maximum(idxs - w, 0))
+        ends.append(np.minimum(idxs + w, n))
+        owner.append(np.full(len(idxs), r))
+
+    # Paint the intervals: +1 at each start, -1 at each end, running sum > 0
+    paint = np.zeros((len(rows), n + 1), dtype=np.int32)
+    if starts:
+        owner = np.concatenate(owner)
+        np.add.at(paint, (owner, np.concatenate(starts)), 1)
+        np.add.at(paint, (owner, np.concatenate(ends)), -1)
+    mask = (np.cumsum(paint[:, :n], axis=-1) > 0) | (fixed > 0)
+
+    # Masked mean and (population) standard deviation along the last axis
+    count = (~mask).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(mask, 0, smooth).sum(axis=-1) / count
+        anom = np.where(mask, 0, smooth - mean[:, None])
+        std  = np.sqrt((anom * anom).sum(axis=-1) / count)
+
+    baseline_mean = np.round(mean, roundto).reshape(block.shape[:-1])
+    baseline_std  = np.round(std, roundto).reshape(block.shape[:-1])
+
+    if subtract == True:
+        block -= baseline_mean[..., None]
+
+    if return_mask == True:
+        return baseline_mean, baseline_std, mask.reshape(block.shape)
+
+    return baseline_mean, baseline_std
+
+
+def robust_baselines(block, nmad=4, max_reject=0.01, min_window=16, min_sigma=None, roundto=2, subtract=True,
+                     **kwargs):
+    """
+    Cheap baseline estimate over the pre-trigger window only, the part of the
+    record find_baseline leaves unmasked (samples 40 to len/2 - 25, the trigger
+    being at the midpoint). In one vectorized pass over the block it takes the
+    median and the MAD of each window, rejects samples further than nmad
+    robust deviations from the median, and averages the rest. On digitizer
+    data with noise of about one step the MAD is 0, so the robust deviation
+    is floored at the digitizer step, estimated as the smallest nonzero
+    difference between neighbouring samples of the window.
+
+    A window with more than a fraction max_reject of rejected samples holds a
+    pulse (pile-up), and its baseline is recomputed with the peak-masking
+    method of find_baselines instead. So are all waveforms of records too
+    short to have a pre-trigger window of min_window samples; records of
+    about 130 samples or fewer have no unmasked samples for either method
+    and get NaN, as from find_baselines.
+
+    Args:
+        block (ndarray)    : waveforms along the last axis, any leading shape
+        nmad (float)       : rejection threshold in robust standard deviations
+                             (1.4826 * MAD)
+        max_reject (float) : fraction of rejected samples above which a window
+                             falls back to find_baselines
+        min_window (int)   : shortest pre-trigger window in samples, below which
+                             every waveform falls back to find_baselines
+        min_sigma (float)  : floor of the robust deviation, in the units of the
+                             waveforms, instead of the estimated digitizer step
+        roundto (int)      : decimals the baselines are rounded to
+        subtract (bool)    : subtract each baseline mean from its waveform in place
+        **kwargs           : passed on to find_baselines for the fallback
+    Returns:
+        baseline_mean (ndarray) : baseline of each waveform, shape block.shape[:-1]
+        baseline_std  (ndarray) : standard deviation of each baseline
+        pileup (ndarray)        : bool, True where the fallback was used
+    """
+    block  = np.asarray(block)
+    n      = block.shape[-1]
+    window = block.reshape(-1, n)[:, 40:int(n/2)-25].astype(float, copy=False)
+
+    if window.shape[-1] < min_window:
+        baseline_mean, baseline_std = find_baselines(block, roundto=roundto, subtract=subtract, **kwargs)
+        return baseline_mean, baseline_std, np.ones(block.shape[:-1], dtype=bool)
+
+    median = np.median(window, axis=-1, keepdims=True)
+    dev    = np.abs(window - median)
+    sigma  = 1.4826 * np.median(dev, axis=-1, keepdims=True)
+
+    # Floor at the digitizer step (or min_sigma), which the MAD of quantized noise can fall below
+    if min_sigma is None:
+        step      = np.abs(np.diff(window, axis=-1))
+        min_sigma = np.min(np.where(step > 0, step, np.inf), axis=-1, keepdims=True)
+        min_sigma = np.where(np.isfinite(min_sigma), min_sigma, 0)
+    keep   = dev <= nmad * np.maximum(sigma, min_sigma)
+
+    count = keep.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(keep, window, 0).sum(axis=-1) / count
+        anom = np.where(keep, window - mean[:, None], 0)
+        std  = np.sqrt((anom * anom).sum(axis=-1) / count)
+
+    pileup = count < (1 - max_reject) * window.shape[-1]
+    if pileup.any():
+        rows = block.reshape(-1, n)[pileup]
+        mean[pileup], std[pileup] = find_baselines(rows, roundto=roundto, subtract=False, **kwargs)
+
+    baseline_mean = np.round(mean, roundto).reshape(block.shape[:-1])
+    baseline_std  = np.round(std, roundto).reshape(block.shape[:-1])
+    pileup        = pileup.reshape(block.shape[:-1])
+
+    if subtract == True:
+        block -= baseline_mean[..., None]
 
+    return baseline_mean, baseline_std, pileup
+
+
+def smoothing_radius(sigma, truncate=4.0):
+    """
+    Args:
+        sigma (float)    : width of the Gaussian smoothing kernel in samples
+        truncate (float) : kernel cut-off in sigmas, as in gaussian_filter1d
+    Returns:
+        radius (int) : number of samples on each side that affect a smoothed sample
+    """
+    return int(truncate * float(sigma) + 0.5)
+
+
+def smooth_roi(wf, a, b, sigma=2):
+    """
+    Gaussian smoothing of wf[..., a:b] only, reading a kernel-width margin on
+    each side. Identical to gaussian_filter1d(wf, sigma, axis=-1)[..., a:b],
+    without smoothing the samples outside the ROI.
+
+    Args:
+        wf (ndarray)  : waveform, or waveforms along the last axis
+        a (int)       : first sample of the ROI
+        b (int)       : end (exclusive) of the ROI
+        sigma (float) : smoothing width in samples
+    Returns:
+        wf_sm (ndarray) : smoothed ROI
+    """
+    n  = np.shape(wf)[-1]
+    a  = min(max(int(a), 0), n)
+    b  = min(max(int(b), a), n)
+    r  = smoothing_radius(sigma)
+    lo = max(a - r, 0)
+    hi = min(b + r, n)
+
+    wf_sm = scipy.ndimage.gaussian_filter1d(np.asarray(wf)[..., lo:hi], sigma=sigma, axis=-1)
+
+    return wf_sm[..., a-lo:b-lo]
+
+
+def get_first_peak(wf, threshold, ROI, min_val=50, smooth=True, sigma=2):
+    """
+    Finds the first peak above threshold inside the ROI of the (smoothed)
+    waveform. Only the ROI, plus the margin the smoothing kernel needs, is smoothed.
+
+    Args:
+        wf (ndarray)      : waveform
+        threshold (float) : minimum peak height
+        ROI (tuple)       : (first, end) sample indices of the region of interest
+        min_val (float)   : unused, kept for compatibility
+        smooth (bool)     : smooth the waveform before peak finding
+        sigma (float)     : smoothing width in samples
+    Returns:
+        peak_idx (int)   : index of the first peak in wf, None if there is none
+        peak_val (float) : height of the (smoothed) peak, None if there is none
+    """
     # Starting and end cuts of Region Of Interest
     a = int(ROI[0]); b = int(ROI[1])
 
-    # Cut the waveform
-    wf_cut = wf_sm[a:b]
+    # Cut (and smooth) the waveform
+    if smooth == True:
+        wf_cut = smooth_roi(wf, a, b, sigma=sigma)
+    else:
+        wf_cut = np.asarray(wf)[a:b]
 
     # Find peaks
     peaks  = scipy.signal.find_peaks(wf_cut, height=threshold, width=6, distance=10, prominence=12)
@@ -179,6 +472,62 @@ def get_first_peak(wf, threshold, ROI, min_val=50, smooth=True, sigma=2):
         return None, None
 
 
+def get_first_peaks(block, threshold, ROI, smooth=True, sigma=2, smoothed=None):
+    """
+    Batched get_first_peak over a block of waveforms. The ROIs of all
+    waveforms are smoothed in one call, and find_peaks only runs on waveforms
+    whose ROI reaches the threshold.
+
+    Args:
+        block (ndarray)    : waveforms along the last axis, any leading shape
+        threshold (float)  : minimum peak height
+        ROI (tuple)        : (first, end) sample indices of the region of interest,
+                             each an int or an array broadcast to block.shape[:-1]
+                             (for example one ROI per scope)
+        smooth (bool)      : smooth the waveforms before peak finding
+        sigma (float)      : smoothing width in samples
+        smoothed (ndarray) : the block already smoothed with sigma, to reuse
+                             (see Event.smoothed), instead of smoothing the ROIs
+    Returns:
+        peak_idx (ndarray) : index of the first peak of each waveform, -1 if none
+        peak_val (ndarray) : height of each first peak, NaN if none
+    """
+    block = np.asarray(block)
+    n     = block.shape[-1]
+    shape = block.shape[:-1]
+    rows  = block.reshape(-1, n)
+
+    a = np.clip(np.broadcast_to(np.asarray(ROI[0], dtype=int), shape).ravel(), 0, n)
+    b = np.clip(np.broadcast_to(np.asarray(ROI[1], dtype=int), shape).ravel(), 0, n)
+    b = np.maximum(a, b)
+
+    peak_idx = np.full(len(rows), -1, dtype=int)
+    peak_val = np.full(len(rows), np.nan)
+    if len(rows) == 0:
+        return peak_idx.reshape(shape), peak_val.reshape(shape)
+
+    # One window covering every ROI, smoothed once for the whole block
+    lo, hi = int(a.min()), int(b.max())
+    if smoothed is not None:
+        window = np.asarray(smoothed).reshape(-1, n)[:, lo:hi]
+    elif smooth == True:
+        window = smooth_roi(rows, lo, hi, sigma=sigma)
+    else:
+        window = rows[:, lo:hi]
+
+    for r in range(len(rows)):
+        wf_cut = window[r, a[r]-lo:b[r]-lo]
+        if len(wf_cut) == 0 or not wf_cut.max() >= threshold:
+            continue
+
+        peaks = scipy.signal.find_peaks(wf_cut, height=threshold, width=6, distance=10, prominence=12)
+        if len(peaks[0]):
+            peak_idx[r] = a[r] + peaks[0][0]
+            peak_val[r] = peaks[1]['peak_heights'][0]
+
+    return peak_idx.reshape(shape), peak_val.reshape(shape)
+
+
 def get_risetime(t, wf, peak_idx, ROI, fraction=0.12, const = None):
     """
     <Description>
@@ -194,8 +543,8 @@ def get_risetime(t, wf, peak_idx, ROI, fraction=0.12, const = None):
         rise_val = peak_val * fraction
     
 
-    a = np.argmin(np.abs(t - ROI[0]))
-    b = np.argmin(np.abs(t - ROI[1]))
+    a = time_index(t, ROI[0])
+    b = time_index(t, ROI[1])
     ROI_idx = (a,b)
     # Generate inverse and reversed interpolated function up to peak
     t_cut    = t[a:peak_idx][::-1]
@@ -212,6 +561,210 @@ def get_risetime(t, wf, peak_idx, ROI, fraction=0.12, const = None):
 
     
 
+def leading_edge_times(block, t, peak_idx, start_idx, fraction=0.12, const=None):
+    """
+    Vectorized leading-edge timing over a block of waveforms. For each waveform
+    it finds the last sample below fraction*peak (or const) between start_idx
+    and the peak, and interpolates linearly between that sample and the next
+    one for the crossing time. Replaces the per-waveform interp1d of get_risetime.
+
+    This is a different definition from get_risetime's: get_risetime sorts the
+    samples before the peak by voltage and interpolates between the two nearest
+    the level, which need not be neighbours in time once noise makes the edge
+    non-monotonic. The two agree on monotonic edges only; on noisy edges this
+    function returns the last crossing before the peak (see bench_leading_edge.py,
+    where up to ~20% of noisy pulses differ, by up to ~15 ns).
+
+    Several fractions (or constant thresholds) are timed in one pass over each
+    leading edge: the running minimum of the edge, taken backwards from the
+    peak, is non-decreasing, so the last sample below any level is found by
+    counting how much of it lies below that level.
+
+    Args:
+        block (ndarray)          : waveforms along the last axis, any leading shape
+        t (TimeAxis/list)        : sample times shared by all waveforms (TimeAxis or
+                                   1D array), or a list with one per waveform
+        peak_idx (ndarray)       : peak index of each waveform, -1 if there is none
+        start_idx (ndarray)      : first sample searched (the ROI start) of each
+                                   waveform, or one int for all
+        fraction (float/ndarray) : fraction(s) of the peak height to time at
+        const (float/ndarray)    : fixed level(s) to time at instead, if given
+    Returns:
+        times (ndarray) : crossing time of each waveform, NaN where there is no
+                          peak or no sample below the level before it. Shape
+                          block.shape[:-1], plus a last axis over the levels if
+                          fraction or const is an array.
+    """
+    block = np.asarray(block)
+    n     = block.shape[-1]
+    shape = block.shape[:-1]
+    rows  = block.reshape(-1, n)
+    m     = len(rows)
+
+    peak  = np.broadcast_to(np.asarray(peak_idx, dtype=int), shape).ravel()
+    start = np.broadcast_to(np.asarray(start_idx, dtype=int), shape).ravel()
+    valid = (peak >= 0) & (peak < n)
+    peak  = np.where(valid, peak, 0)
+    r     = np.arange(m)
+
+    # Levels to time at, one column per fraction or threshold
+    if const is not None:
+        levels = np.broadcast_to(np.atleast_1d(np.asarray(const, dtype=float)), (m, np.size(const)))
+        scalar = np.ndim(const) == 0
+    else:
+        levels = rows[r, peak][:, None] * np.atleast_1d(np.asarray(fraction, dtype=float))[None, :]
+        scalar = np.ndim(fraction) == 0
+
+    # Running minimum of each edge in [start, peak), backwards from the peak,
+    # over the columns between the earliest start and the latest peak only
+    lo   = int(np.clip(start[valid].min(), 0, n)) if valid.any() else 0
+    hi   = max(int(peak[valid].max()), lo) if valid.any() else lo
+    idx  = np.arange(lo, hi)
+    edge = np.where((idx >= start[:, None]) & (idx < peak[:, None]), rows[:, lo:hi], np.inf)
+    rmin = np.fmin.accumulate(edge[:, ::-1], axis=-1)[:, ::-1]
+
+    # Samples up to the last one below a level are exactly those whose
+    # running minimum is below it
+    count = (rmin[:, :, None] < levels[:, None, :]).sum(axis=1)
+    found = (count > 0) & valid[:, None]
+    j     = lo + np.maximum(count - 1, 0)
+    k     = np.minimum(j + 1, n - 1)
+
+    # Times of the bracketing samples
+    if isinstance(t, (list, tuple)) and all(isinstance(ti, TimeAxis) for ti in t):
+        origin    = np.array([ti.origin for ti in t])[:, None]
+        increment = np.array([ti.increment for ti in t])[:, None]
+        t_j, t_k  = origin + j * increment, origin + k * increment
+    elif isinstance(t, (list, tuple)):
+        t_j = np.array([np.asarray(ti, dtype=float)[row] for ti, row in zip(t, j)])
+        t_k = np.array([np.asarray(ti, dtype=float)[row] for ti, row in zip(t, k)])
+    elif isinstance(t, TimeAxis):
+        t_j, t_k = t.time(j), t.time(k)
+    else:
+        t_j, t_k = np.asarray(t, dtype=float)[j], np.asarray(t, dtype=float)[k]
+
+    v_j = rows[r[:, None], j]
+    v_k = rows[r[:, None], k]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        times = t_j + (levels - v_j) * (t_k - t_j) / (v_k - v_j)
+
+    times = np.where(found, times, np.nan)
+    if scalar:
+        return times[:, 0].reshape(shape)
+
+    return times.reshape(shape + (levels.shape[-1],))
+
+
+def cfd_times(block, t, ROI, fraction=0.3, delay=2.0, threshold=140, sigma=2, return_peaks=False):
+    """
+    Digital constant-fraction discriminator over a block of waveforms. Each
+    waveform is turned into the bipolar signal fraction*wf(t) - wf(t - delay)
+    with one array shift. The CFD arms where the smoothed waveform first
+    reaches threshold inside the ROI, as get_first_peak requires of a peak,
+    and is timed at the zero crossing of the pulse's bipolar signal: the first
+    negative sample after its maximum before the arm point, interpolated
+    linearly between the bracketing samples. The crossing time does not
+    depend on the pulse amplitude, and no peak search is needed.
+
+    Args:
+        block (ndarray)     : waveforms along the last axis, any leading shape
+        t (TimeAxis/list)   : sample times shared by all waveforms (TimeAxis or
+                              1D array), or a list with one per waveform
+        ROI (tuple)         : (first, end) sample indices in which the CFD is
+                              armed, each an int or an array broadcast to
+                              block.shape[:-1]
+        fraction (float)    : CFD fraction
+        delay (float)       : CFD delay, in the units of t (ns for Event times),
+                              rounded to whole samples
+        threshold (float)   : minimum height of the smoothed pulse, as in get_first_peak
+        sigma (float)       : Gaussian smoothing width in samples, None for none
+        return_peaks (bool) : also return the maximum of the smoothed ROI of
+                              each armed waveform, a cheap stand-in for its
+                              first peak
+    Returns:
+        times (ndarray)    : zero-crossing time of each waveform, NaN where the
+                             CFD never arms or does not cross zero
+        peak_idx (ndarray) : sample of the ROI maximum, -1 where not armed.
+                             Only if return_peaks.
+        peak_val (ndarray) : smoothed waveform at peak_idx, NaN where not armed.
+                             Only if return_peaks.
+    """
+    block = np.asarray(block)
+    n     = block.shape[-1]
+    shape = block.shape[:-1]
+    rows  = block.reshape(-1, n)
+    m     = len(rows)
+    r     = np.arange(m)
+
+    a = np.clip(np.broadcast_to(np.asarray(ROI[0], dtype=int), shape).ravel(), 0, n)
+    b = np.clip(np.broadcast_to(np.asarray(ROI[1], dtype=int), shape).ravel(), 0, n)
+
+    # Origin and sample spacing of each waveform
+    if isinstance(t, (list, tuple)):
+        axes = [ti if isinstance(ti, TimeAxis) else TimeAxis.from_array(ti) for ti in t]
+    else:
+        axes = [t if isinstance(t, TimeAxis) else TimeAxis.from_array(t)]
+    origin    = np.broadcast_to(np.array([ax.origin for ax in axes]), (m,))
+    increment = np.broadcast_to(np.array([ax.increment for ax in axes]), (m,))
+    shift     = np.rint(np.broadcast_to(delay, (m,)) / increment).astype(int)
+
+    if m == 0 or not (b > a).any():
+        if return_peaks == True:
+            return np.full(shape, np.nan), np.full(shape, -1, dtype=int), np.full(shape, np.nan)
+        return np.full(shape, np.nan)
+
+    # Work from the earliest ROI start, less the delay, to the end: the
+    # crossing can come after the ROI end, at the latest one delay after the peak
+    lo = max(int(a.min()) - int(shift.max()), 0)
+    hi = n
+    if sigma is not None:
+        wf = smooth_roi(rows.astype(float, copy=False), lo, hi, sigma=sigma)
+    else:
+        wf = rows[:, lo:hi].astype(float, copy=False)
+
+    # Bipolar signal: fraction*wf(t) - wf(t - delay), the start held at the first sample
+    idx     = np.arange(lo, hi)
+    delayed = np.take_along_axis(wf, np.clip(idx - lo - shift[:, None], 0, None), axis=-1)
+    bipolar = fraction * wf - delayed
+
+    # Arm where the smoothed waveform first reaches the threshold inside the ROI
+    in_ROI = (idx >= a[:, None]) & (idx < b[:, None])
+    armed  = in_ROI & (wf >= threshold)
+    i_arm  = np.argmax(armed, axis=-1)
+
+    # Maximum of the bipolar signal up to the arm point, from the ROI start
+    # less the delay: the pulse's positive lobe, whether the zero crossing
+    # comes before the arm point (small pulses) or after it (large ones)
+    col    = np.arange(hi - lo)
+    search = (idx >= (a - shift)[:, None]) & (col <= i_arm[:, None])
+    i_max  = np.argmax(np.where(search, bipolar, -np.inf), axis=-1)
+
+    # First negative sample after that maximum
+    after = (col > i_max[:, None]) & (bipolar < 0)
+    k     = np.argmax(after, axis=-1)
+    found = armed.any(axis=-1) & (bipolar[r, i_max] > 0) & after.any(axis=-1)
+    k     = np.where(found, k, 1)
+
+    # Linear interpolation of the zero crossing between samples k-1 and k
+    s_j = bipolar[r, k - 1]
+    s_k = bipolar[r, k]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        times = origin + (lo + k - 1 + s_j / (s_j - s_k)) * increment
+
+    times = np.where(found, times, np.nan).reshape(shape)
+    if return_peaks == False:
+        return times
+
+    # Maximum of the smoothed ROI of each armed waveform
+    roi_wf   = np.where(in_ROI, wf, -np.inf)
+    i_peak   = np.argmax(roi_wf, axis=-1)
+    is_armed = armed.any(axis=-1)
+    peak_idx = np.where(is_armed, lo + i_peak, -1).reshape(shape)
+    peak_val = np.where(is_armed, wf[r, i_peak], np.nan).reshape(shape)
+
+    return times, peak_idx, peak_val
+
+
 # === PHASING OUT === #
 
 def find_peak(wf, threshold, ROI, sigma=2, min_val=50, div=8):
@@ -0,0 +1,158 @@
+import os
+import re
+import numpy as np
+
+import utils.binfile as bf
+import utils.store as st
+
+# Converted csv file name: <scope>_segment-<n>_<channel>.csv
+CSV_NAME = re.compile(r'^(?P<scope>.+)_segment-(?P<segment>\d+)_(?P<channel>[^.]+)\.csv$')
+
+
+class RunIndex:
+    """
+    Index of the scopes, segments and channels available in a run directory,
+    built from a single os.scandir pass over the converted csv files. The raw
+    <scope>.bin files and <scope>.npz stores found in the same pass are
+    indexed from their own header tables, without touching the waveforms.
+
+    Run loops use it to visit exactly the segments that exist, instead of
+    probing segment after segment until a read fails.
+    """
+    def __init__(self, run_path):
+        """
+        Args:
+            run_path (str) : path to directory containing the run files
+        """
+        self.run_path = run_path
+
+        self.csv   = {} # scope -> {segment: set of channels}
+        self.files = {'bin': {}, 'store': {}} # source -> {scope: path}
+
+        with os.scandir(run_path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.endswith('.csv'):
+                    match = CSV_NAME.match(name)
+                    if match:
+                        segments = self.csv.setdefault(match['scope'], {})
+                        segments.setdefault(int(match['segment']), set()).add(match['channel'])
+                elif name.endswith('.bin'):
+                    self.files['bin'][name[:-4]] = entry.path
+                elif name.endswith('.npz'):
+                    self.files['store'][name[:-4]] = entry.path
+
+        self._mapped = {}
+
+    def _source_table(self, scope, source):
+        """
+        Returns {segment: set of channels} of a scope for the given source.
+        """
+        if source == 'csv':
+            return self.csv.get(scope, {})
+
+        if source not in self.files:
+            raise ValueError(f"Unknown source '{source}', expected 'csv', 'bin' or 'store'")
+
+        key = (scope, source)
+        if key not in self._mapped:
+            table = {}
+            path  = self.files[source].get(scope)
+            if path is not None:
+                if source == 'bin':
+                    runfile = bf.open_segmented(path)
+                    for seg, label in runfile.index:
+                        table.setdefault(seg, set()).add(label)
+                else:
+                    runfile = st.open_store(path)
+                    for seg in runfile.segments:
+                        table[int(seg)] = set(runfile.channels)
+            self._mapped[key] = table
+
+        return self._mapped[key]
+
+    def scopes(self, source='csv'):
+        """
+        Args:
+            source (str) : 'csv', 'bin' or 'store'
+        Returns:
+            scopes (list) : sorted names of the scopes with data, example: 'scope-1-run8'
+        """
+        if source == 'csv':
+            return sorted(self.csv)
+
+        return sorted(self.files[source])
+
+    def channels(self, scope, source='csv'):
+        """
+        Args:
+            scope (str)  : scope name
+            source (str) : 'csv', 'bin' or 'store'
+        Returns:
+            channels (list) : sorted labels of the channels found in any segment
+        """
+        labels = set()
+        for chs in self._source_table(scope, source).values():
+            labels |= chs
+
+        return sorted(labels, key=lambda ch: (not ch.isdigit(), int(ch) if ch.isdigit() else ch))
+
+    def segments(self, scope_config=None, source='csv'):
+        """
+        Args:
+            scope_config (ndarray) : scopes and their number of channels, as for Event.
+                                     All scopes, with any channels, if None.
+            source (str)           : 'csv', 'bin' or 'store'
+        Returns:
+            segments (ndarray) : sorted segments holding every channel 1..n of every scope
+        """
+        if scope_config is None:
+            scope_config = [(scope, 0) for scope in self.scopes(source)]
+
+        common = None
+        for scope in scope_config:
+            needed = {str(ch) for ch in range(1, scope[1]+1)}
+            found  = {seg for seg, chs in self._source_table(scope[0], source).items() if needed <= chs}
+            common = found if common is None else common & found
+
+        return np.array(sorted(common or ()), dtype=np.int64)
+
+    def has_segment(self, segment, scope_config, source='csv'):
+        """
+        Args:
+            segment (int)          : segment index
+            scope_config (ndarray) : scopes and their number of channels, as for Event
+            source (str)           : 'csv', 'bin' or 'store'
+        Returns:
+            exists (bool) : whether every channel of every scope has the segment
+        """
+        for scope in scope_config:
+            chs = self._source_table(scope[0], source).get(int(segment), set())
+            if not {str(ch) for ch in range(1, scope[1]+1)} <= chs:
+                return False
+
+        return True
+
+
+# Process-wide cache of run indices, keyed by path and directory mtime
+_run_indices = {}
+
+def run_index(run_path):
+    """
+    Returns the RunIndex of a run directory, rebuilding it only when the
+    directory has changed (files added or removed) since it was last built.
+
+    Args:
+        run_path (str) : path to directory containing the run files
+    Returns:
+        index (RunIndex)
+    """
+    run_path = os.path.abspath(run_path)
+    mtime    = os.stat(run_path).st_mtime_ns
+
+    cached = _run_indices.get(run_path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, RunIndex(run_path))
+        _run_indices[run_path] = cached
+
+    return cached[1]
@@ -0,0 +1,344 @@
+import os
+import zipfile
+import numpy as np
+
+import utils.binfile as bf
+from utils.timeaxis import TimeAxis
+
+# Code marking missing samples in quantized blocks
+QUANT_MISSING = np.iinfo(np.int16).min
+
+# =========================================================
+# Quantization
+# =========================================================
+
+def quantization_scale(values):
+    """
+    Finds an int16 scale (y_origin, y_increment) for the voltages of one
+    channel. The scope digitizer puts voltages on a regular grid of far fewer
+    than 2^16 levels; if that grid is found (as the smallest step between
+    distinct values) it is used, so quantization loses nothing at the native
+    precision. Otherwise the range is spread over the full int16 range.
+
+    Args:
+        values (ndarray) : voltages of one channel, any shape, NaN ignored
+    Returns:
+        y_origin (float)    : voltage of code 0
+        y_increment (float) : voltage step of one code
+    """
+    levels = np.unique(values[np.isfinite(values)]).astype(np.float64)
+    if len(levels) == 0:
+        return 0.0, 1.0
+    if len(levels) == 1:
+        return float(levels[0]), 1.0
+
+    lo, hi = levels[0], levels[-1]
+
+    # Smallest step between levels, refined over the whole range so float32
+    # rounding of the individual levels averages out
+    step = np.diff(levels).min()
+    step = (hi - lo) / max(np.rint((hi - lo) / step), 1)
+
+    # Native grid: every level is (close to) a whole number of steps from lo
+    on_grid = np.abs((levels - lo) / step - np.rint((levels - lo) / step)).max() < 1e-2
+    if not on_grid or (hi - lo) / step > 2 * 32767 - 1:
+        step = (hi - lo) / (2 * 32767 - 1)
+
+    y_origin = lo + np.rint((hi - lo) / 2 / step) * step
+    return float(y_origin), float(step)
+
+
+def quantize(values, y_origin, y_increment):
+    """
+    Args:
+        values (ndarray)    : voltages
+        y_origin (float)    : voltage of code 0
+        y_increment (float) : voltage step of one code
+    Returns:
+        codes (ndarray) : int16 codes, QUANT_MISSING where values are NaN
+    """
+    codes = np.rint((values - y_origin) / y_increment)
+    codes = np.where(np.isfinite(codes), np.clip(codes, QUANT_MISSING + 1, 32767), QUANT_MISSING)
+
+    return codes.astype(np.int16)
+
+
+def dequantize(codes, y_origin, y_increment):
+    """
+    Args:
+        codes (ndarray)             : int16 codes
+        y_origin (float/ndarray)    : voltage of code 0, broadcast against codes
+        y_increment (float/ndarray) : voltage step of one code
+    Returns:
+        values (ndarray) : float32 voltages, NaN for missing samples
+    """
+    values = (codes.astype(np.float32) * np.asarray(y_increment, dtype=np.float32)
+              + np.asarray(y_origin, dtype=np.float32))
+    values[codes == QUANT_MISSING] = np.nan
+
+    return values
+
+
+# =========================================================
+# Writing run stores
+# =========================================================
+
+def write_run_store(bin_path, store_path, compress=False, quantize_int16=False):
+    """
+    Converts a segmented InfiniiVision binary file into a single per-run
+    array store (.npz) holding a (segments x channels x samples) float32
+    block together with the per-waveform metadata and timestamps. With
+    quantize_int16 the block is stored as int16 codes plus a per-channel
+    (y_origin, y_increment) scale instead, half the size of float32. Digital
+    (logic) channels are kept packed, as a (segments x digital channels x
+    samples) uint8 block of byte codes.
+
+    Args:
+        bin_path (str)   : path to the .bin scope file
+        store_path (str) : path (or open binary file) of the .npz store to write
+                           example filename: 'scope-1-run8.npz'
+        compress (bool)  : deflate the store. Compressed stores are smaller
+                           but cannot be memory-mapped on load.
+        quantize_int16 (bool) : store int16 codes instead of float32 voltages
+                                (see quantization_scale)
+    Returns:
+        shape (tuple) : shape of the stored waveform block
+    """
+    binfile  = bf.SegmentedBinFile(bin_path)
+    table    = binfile.table
+    segments = binfile.segments
+    channels = binfile.channels
+    digital  = binfile.digital_channels
+    points   = int(table['points'].max()) if len(table) else 0
+
+    data        = np.full((len(segments), len(channels), points), np.nan, dtype=np.float32)
+    x_origin    = np.full((len(segments), len(channels)), np.nan)
+    x_increment = np.full((len(segments), len(channels)), np.nan)
+    time_tags   = np.full(len(segments), np.nan)
+    codes       = np.zeros((len(segments), len(digital), points), dtype=np.uint8)
+
+    seg_pos = np.searchsorted(segments, table['segment'])
+    ch_pos  = {ch: num for num, ch in enumerate(channels)}
+    dig_pos = {ch: num for num, ch in enumerate(digital)}
+
+    for row, s in zip(table, seg_pos):
+        wf = binfile.get_waveform(row['segment'], row['label'])
+        time_tags[s] = row['time_tag']
+
+        if row['buffer_type'] == bf.DIGITAL_BUFFER_TYPE:
+            codes[s, dig_pos[str(row['label'])], :len(wf)] = wf
+            continue
+
+        c = ch_pos[str(row['label'])]
+        data[s, c, :len(wf)] = wf
+        x_origin[s, c]       = row['x_origin']
+        x_increment[s, c]    = row['x_increment']
+
+    # Per-channel int16 scale, identity for float32 stores
+    y_origin    = np.zeros(len(channels))
+    y_increment = np.ones(len(channels))
+    if quantize_int16:
+        block = np.empty(data.shape, dtype=np.int16)
+        for c in range(len(channels)):
+            y_origin[c], y_increment[c] = quantization_scale(data[:, c])
+            block[:, c] = quantize(data[:, c], y_origin[c], y_increment[c])
+        data = block
+
+    save = np.savez_compressed if compress else np.savez
+    save(store_path,
+         data             = data,
+         y_origin         = y_origin,
+         y_increment      = y_increment,
+         segments         = segments.astype(np.int64),
+         channels         = np.array(channels),
+         x_origin         = x_origin,
+         x_increment      = x_increment,
+         time_tags        = time_tags,
+         digital          = codes,
+         digital_channels = np.array(digital, dtype=str),
+         source           = np.array(os.path.basename(bin_path)))
+
+    return data.shape
+
+
+# =========================================================
+# Reading run stores
+# =========================================================
+
+def _mmap_npz_member(store_path, name):
+    """
+    Memory-maps an array stored uncompressed inside an .npz archive.
+    Returns None if the member is compressed and must be read normally.
+    """
+    with zipfile.ZipFile(store_path) as zf:
+        info = zf.getinfo(f'{name}.npy')
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+
+    with open(store_path, 'rb') as f:
+        # Skip the zip local file header to reach the .npy payload
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if np.prod(shape) == 0:
+        return np.empty(shape, dtype=dtype)
+
+    return np.memmap(store_path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+class RunStore:
+    """
+    Loader of a per-run array store written by write_run_store. The waveform
+    block is memory-mapped when the store is uncompressed, so opening a run
+    costs almost nothing until segments are accessed. Quantized (int16)
+    stores are dequantized to float32 only for the waveforms requested.
+    """
+    def __init__(self, store_path, mmap=True):
+        """
+        Args:
+            store_path (str) : path to the .npz store
+            mmap (bool)      : memory-map the waveform block where possible
+        """
+        self.filepath = store_path
+
+        with np.load(store_path) as npz:
+            self.segments    = npz['segments']
+            self.channels    = [str(ch) for ch in npz['channels']]
+            self.x_origin    = npz['x_origin']
+            self.x_increment = npz['x_increment']
+            self.time_tags   = npz['time_tags']
+
+            data = _mmap_npz_member(store_path, 'data') if mmap else None
+            if data is None:
+                data = npz['data']
+
+            # Stores written before quantization was supported are float32
+            if 'y_origin' in npz.files:
+                self.y_origin    = npz['y_origin']
+                self.y_increment = npz['y_increment']
+            else:
+                self.y_origin    = np.zeros(len(self.channels))
+                self.y_increment = np.ones(len(self.channels))
+
+            # Stores written before digital channels were supported have none
+            if 'digital' in npz.files:
+                self.digital          = npz['digital']
+                self.digital_channels = [str(ch) for ch in npz['digital_channels']]
+            else:
+                self.digital          = np.zeros(data.shape[:1] + (0,) + data.shape[2:], dtype=np.uint8)
+                self.digital_channels = []
+
+        self.data      = data
+        self.quantized = data.dtype == np.int16
+        self.dig_pos = {ch: num for num, ch in enumerate(self.digital_channels)}
+
+        self.seg_pos = {int(seg): num for num, seg in enumerate(self.segments)}
+        self.ch_pos  = {ch: num for num, ch in enumerate(self.channels)}
+
+    def locate(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index, as numbered by the scope
+            channel (int/str) : channel label, example: 1 or '1'
+        Returns:
+            (s, c) (tuple) : position of the waveform in the block
+        """
+        try:
+            return self.seg_pos[int(segment)], self.ch_pos[str(channel)]
+        except KeyError:
+            raise KeyError(f"No waveform for segment {segment}, channel '{channel}' in {self.filepath}")
+
+    def get_waveform(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index
+            channel (int/str) : channel label
+        Returns:
+            wf (ndarray) : float32 waveform in volts (a view into the block,
+                           or dequantized for int16 stores)
+        """
+        s, c = self.locate(segment, channel)
+        if self.quantized:
+            return dequantize(self.data[s, c], self.y_origin[c], self.y_increment[c])
+
+        return self.data[s, c]
+
+    def get_block(self, segments=slice(None), channels=slice(None)):
+        """
+        Args:
+            segments (slice/ndarray) : positions of the segments in the block
+            channels (slice/ndarray) : positions of the channels in the block
+        Returns:
+            block (ndarray) : float32 (segments x channels x samples) voltages,
+                              a view for float32 stores
+        """
+        block = self.data[segments][:, channels]
+        if self.quantized:
+            return dequantize(block, self.y_origin[channels][None, :, None],
+                              self.y_increment[channels][None, :, None])
+
+        return block
+
+    def get_digital(self, segment, channel):
+        """
+        Args:
+            segment (int) : segment index
+            channel (str) : digital channel label
+        Returns:
+            bits (ndarray) : (samples x 8) uint8 array of 0/1, most significant
+                             bit first
+        """
+        try:
+            s, d = self.seg_pos[int(segment)], self.dig_pos[str(channel)]
+        except KeyError:
+            raise KeyError(f"No digital waveform for segment {segment}, channel '{channel}' in {self.filepath}")
+
+        return bf.unpack_digital(self.digital[s, d])
+
+    def get_time_axis(self, segment, channel):
+        """
+        Args:
+            segment (int)     : segment index
+            channel (int/str) : channel label
+        Returns:
+            t (TimeAxis) : lazy axis of the sample times in seconds
+        """
+        s, c = self.locate(segment, channel)
+        return TimeAxis(self.x_origin[s, c], self.x_increment[s, c], self.data.shape[-1])
+
+
+# Process-wide cache of open run stores, keyed by path, file mtime and size
+_open_stores = {}
+
+def open_store(store_path):
+    """
+    Returns a RunStore for the given path, loading its metadata only the
+    first time it is opened in this process. A store replaced since (for
+    example by a reconversion, which writes a new file and renames it over
+    the old one) has a new mtime and size and is opened again, instead of
+    serving the memory map of the old file.
+
+    Args:
+        store_path (str) : path to the .npz store
+    Returns:
+        store (RunStore)
+    """
+    store_path = os.path.abspath(store_path)
+    stat       = os.stat(store_path)
+    key        = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _open_stores.get(store_path)
+    if cached is None or cached[0] != key:
+        cached = (key, RunStore(store_path))
+        _open_stores[store_path] = cached
+
+    return cached[1]
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class TimeAxis(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Uniformly sampled time axis t[i] = origin + i*increment, stored as its three
+    parameters only. The sample array is built lazily the first time it is needed,
+    and times map to sample indices with O(1) arithmetic instead of an argmin search.
+
+    A TimeAxis behaves like the 1D array it describes: it can be indexed, sliced,
+    plotted and used in numpy arithmetic (t - ROI[0] gives an ndarray).
+    """
+    def __init__(self, origin, increment, points):
+        """
+        Args:
+            origin (float)    : time of the first sample
+            increment (float) : time between samples
+            points (int)      : number of samples
+        """
+        self.origin    = float(origin)
+        self.increment = float(increment)
+        self.points    = int(points)
+
+        self._values = None
+
+    @classmethod
+    def from_array(cls, t):
+        """
+        Args:
+            t (ndarray) : uniformly sampled time values
+        Returns:
+            axis (TimeAxis) : axis through the first and last sample of t
+        """
+        t = np.asarray(t, dtype=float)
+        if len(t) < 2:
+            return cls(t[0] if len(t) else 0.0, 0.0, len(t))
+
+        return cls(t[0], (t[-1] - t[0]) / (len(t) - 1), len(t))
+
+    def scaled(self, factor):
+        """
+        Args:
+            factor (float) : unit conversion factor, example: 1e9 for s to ns
+        Returns:
+            axis (TimeAxis) : the same axis in the new units
+        """
+        return TimeAxis(self.origin * factor, self.increment * factor, self.points)
+
+    @property
+    def values(self):
+        """The sample times as a float64 ndarray, built on first use."""
+        if self._values is None:
+            self._values = self.origin + np.arange(self.points) * self.increment
+        return self._values
+
+    def index(self, t):
+        """
+        Maps times to the index of the nearest sample, clipped to the axis.
+        Equivalent to np.argmin(np.abs(axis - t)) for each t.
+
+        Args:
+            t (float/ndarray) : time or array of times
+        Returns:
+            idx (int/ndarray) : nearest sample index or indices
+        """
+        if self.increment == 0:
+            return np.zeros(np.shape(t), dtype=int) if np.ndim(t) else 0
+
+        # Round half down, so ties go to the lower index as argmin does
+        idx = np.ceil((np.asarray(t, dtype=float) - self.origin) / self.increment - 0.5)
+        idx = np.clip(idx, 0, self.points - 1).astype(int)
+
+        return int(idx) if idx.ndim == 0 else idx
+
+    def time(self, idx):
+        """
+        Args:
+            idx (int/float/ndarray) : sample index, fractional indices allowed
+        Returns:
+            t (float/ndarray) : time at the index
+        """
+        return self.origin + np.asarray(idx) * self.increment
+
+    def __len__(self):
+        return self.points
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.points
+            if not 0 <= key < self.points:
+                raise IndexError(f'index {key} is out of bounds for time axis of {self.points} points')
+            return self.origin + key * self.increment
+
+        return self.values[key]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(x.values if isinstance(x, TimeAxis) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __repr__(self):
+        return f'TimeAxis(origin={self.origin!r}, increment={self.increment!r}, points={self.points})'
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def fit_tracks(x, heights, x_err=None):
+    """
+    Straight-line fits x = slope*height + intercept of the muon track through
+    the hit positions of many events at once, by weighted linear least squares
+    in closed form. Missing hits (NaN positions) are left out of each event's
+    fit; events with fewer than two hits get NaN.
+
+    Args:
+        x (ndarray)       : (events x plates) hit positions along the plates in cm
+        heights (ndarray) : height of each plate in cm, shape (plates,) or that of x
+        x_err (ndarray)   : uncertainties of the positions in cm, broadcast against x.
+                            Hits with a zero or NaN uncertainty are left out.
+                            If None, all hits are weighted equally and the
+                            covariance is scaled by chi2/ndof, as curve_fit does
+                            without sigma.
+    Returns:
+        slope (ndarray)     : dx/dheight of each track
+        intercept (ndarray) : x at height 0
+        cov (ndarray)       : (events x 2 x 2) covariance of (slope, intercept)
+        chi2 (ndarray)      : weighted sum of squared residuals of each fit
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    h = np.broadcast_to(np.asarray(heights, dtype=float), x.shape)
+
+    if x_err is None:
+        w = np.ones(x.shape)
+    else:
+        with np.errstate(divide='ignore'):
+            w = 1 / np.broadcast_to(np.asarray(x_err, dtype=float), x.shape)**2
+
+    hit = np.isfinite(x) & np.isfinite(w)
+    w   = np.where(hit, w, 0)
+    x0  = np.where(hit, x, 0)
+
+    # Weighted sums of the normal equations of every event
+    S   = w.sum(axis=-1)
+    Sh  = (w * h).sum(axis=-1)
+    Shh = (w * h * h).sum(axis=-1)
+    Sx  = (w * x0).sum(axis=-1)
+    Shx = (w * h * x0).sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        D         = S * Shh - Sh * Sh
+        slope     = (S * Shx - Sh * Sx) / D
+        intercept = (Shh * Sx - Sh * Shx) / D
+
+        resid = np.where(hit, x0 - slope[:, None] * h - intercept[:, None], 0)
+        chi2  = (w * resid * resid).sum(axis=-1)
+
+        cov = np.empty(x.shape[:1] + (2, 2))
+        cov[:, 0, 0] = S / D
+        cov[:, 1, 1] = Shh / D
+        cov[:, 0, 1] = cov[:, 1, 0] = -Sh / D
+
+        if x_err is None:
+            ndof = hit.sum(axis=-1) - 2
+            cov *= np.where(ndof > 0, chi2 / ndof, np.inf)[:, None, None]
+
+    # Fewer than two hits, or all at the same height: no line
+    bad = (hit.sum(axis=-1) < 2) | ~(D > 0)
+    slope[bad]     = np.nan
+    intercept[bad] = np.nan
+    cov[bad]       = np.nan
+    chi2[bad]      = np.nan
+
+    return slope, intercept, cov, chi2
+
+
+def zenith_angles(slope, cov=None):
+    """
+    Args:
+        slope (ndarray) : dx/dheight of each track, see fit_tracks
+        cov (ndarray)   : (events x 2 x 2) covariance from fit_tracks
+    Returns:
+        theta (ndarray)     : angle of each track from the vertical in radians,
+                              signed along the plates
+        theta_err (ndarray) : its uncertainty, only if cov is given
+    """
+    theta = np.arctan(slope)
+    if cov is None:
+        return theta
+
+    theta_err = np.sqrt(np.asarray(cov)[..., 0, 0]) / (1 + slope**2)
+
+    return theta, theta_err